@@ -1,9 +1,18 @@
+import pandas as pd
 import streamlit as st
 from config import pages, metric_palette, config
-from utils.data_loader import fetch_data
-from utils.preprocess import select_datasets
+from utils.data_loader import fetch_views, fetch_screens
+from utils.preprocess import dataset_selector
 from app_pages import home, gene, allele, help, citations, custom_gene, custom_allele, psa, clustering
-from utils.auth import check_password
+from utils.auth import check_password, is_admin
+from utils.figure_cache import figure_cache_panel
+from utils.profiling import finish_run, profile_panel, stage, start_run
+
+# Pages get shallow copies of the cached tables (see fetch_views); with
+# copy-on-write, changing one copies it instead of changing the cache.
+# Chained assignment (df[col][rows] = ...) has no effect under copy-on-write,
+# so pages assign through .loc or whole columns
+pd.set_option("mode.copy_on_write", True)
 
 if not check_password():
     st.stop()
@@ -23,32 +32,35 @@ pages = [
     "Citations"
 ]
 
+# Page modules, in the same order as `pages`
+page_modules = [help, home, gene, allele, custom_gene, custom_allele, psa, clustering, citations]
+
 # Select a page
 page = st.sidebar.radio("Select a page", pages)
+page_module = page_modules[pages.index(page)]
+
+# Every run is profiled per stage (see utils/profiling.py); admins see the
+# timings in the sidebar
+start_run(page)
+try:
+    # Load and filter data
+    if page not in [pages[0], pages[8]]: # IMP: If page is not "Help" or "Citations" from config.py
+        datasets = dataset_selector(fetch_screens())
+        if not datasets:
+            st.warning("Select at least one dataset")
+            st.stop()
+        # only the tables this page declares are loaded, and only for the selected screens
+        data = fetch_views(page_module.TABLES, datasets)
+    else:
+        data = {}
+    data["metric_palette"] = metric_palette 
+    data["plotly_config"] = config
 
-# Load and filter data
-data = fetch_data()
-if page not in [pages[0], pages[8]]: # IMP: If page is not "Help" or "Citations" from config.py
-    select_datasets(data)
-data["metric_palette"] = metric_palette 
-data["plotly_config"] = config
-
-# Route pages
-if page == pages[0]:
-    help.render()
-elif page == pages[1]:
-    home.render(data)
-elif page == pages[2]:
-    gene.render(data)
-elif page == pages[3]:
-    allele.render(data)
-elif page == pages[4]:
-    custom_gene.render(data)
-elif page == pages[5]:
-    custom_allele.render(data)
-elif page == pages[6]:
-    psa.render(data)
-elif page == pages[7]:
-    clustering.render(data)
-elif page == pages[8]:
-    citations.render()
\ No newline at end of file
+    # Route pages
+    with stage(f"render: {page}"):
+        page_module.render(data)
+finally:
+    stages = finish_run()
+    if is_admin():
+        profile_panel(stages)
+        figure_cache_panel()
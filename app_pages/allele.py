@@ -1,13 +1,115 @@
 # pages/allele.py
 import streamlit as st
-import io
 import numpy as np
 import seaborn as sns
 import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-from utils.helpers import convert_df, read
+from utils.helpers import HABITUATION_METRICS, convert_df, habituation_curves
+from utils.data_loader import fetch_baseline_data
+from utils.figure_cache import cached_figure, figure_key
+from utils.plots import figure_png, habituation_figure, habituation_png, png_download, rank_figure
+from utils.profiling import stage
 from config import config
 
+# Tables from utils.data_loader.fetch_tables() this page uses
+TABLES = ["tap_output", "tap_summary", "allele_MSD", "allele_profile_data", "id_data"]
+
+
+# Static version of the rank plot for download
+def _rank_png(data_sorted, allele_phenotype_option, allele_option):
+    fig_mpl, ax = plt.subplots(figsize=(6, 12))
+
+    # Loop over each row to plot individual points with error bars
+    for i, row in data_sorted.iterrows():
+        if row['dataset'] == "N2":
+            allele_colors = "red"
+        elif row['dataset'] == allele_option:
+            allele_colors = "magenta"
+        else:
+            allele_colors = "dimgray"
+
+        ax.errorbar(
+            x=row[f"{allele_phenotype_option}-mean"],
+            y=row["dataset"],
+            xerr=[[row[f"{allele_phenotype_option}-mean"] - row[f"{allele_phenotype_option}-ci95_lo"]],
+                [row[f"{allele_phenotype_option}-ci95_hi"] - row[f"{allele_phenotype_option}-mean"]]],
+            fmt='o',
+            color=allele_colors,
+            ecolor=allele_colors,
+            elinewidth=1,
+            capsize=3,
+            markersize=6
+        )
+
+    # Vertical reference line and styling
+    ax.axvline(x=0, color='red', linestyle='--')
+    ax.set_xlabel("Sample Mean Distance")
+    ax.set_ylabel("Gene")
+    ax.set_title(f"{allele_phenotype_option}", fontsize=14)
+    ax.set_yticks(range(len(data_sorted["dataset"])))
+    ax.set_yticklabels(data_sorted["dataset"], fontsize=6)
+    ax.invert_yaxis()
+    plt.tight_layout()
+
+    # Add annotation below chart
+    plt.figtext(
+        0.5, -0.05,
+        f'Sample mean distance from wildtype for all strains for selected phenotype: {allele_phenotype_option}. Error bars are 95% CI',
+        wrap=True, ha='center', fontsize=10
+    )
+
+    return figure_png(fig_mpl)
+
+
+# Phenotypic profile of a gene-allele
+def _profile_png(profile_data, allele_option, metric_palette):
+    # seaborn plot
+    sns.set_context('notebook', font_scale=1)
+    fig, ax = plt.subplots(figsize=(5, 10))
+    sns.barplot(x="T_score", # <- Here we use seaborn as our graphing package.
+                y="Metric", orient='h', hue="Metric", legend=False,
+                data=profile_data[profile_data.dataset == f"{allele_option}"],
+                palette=metric_palette, ax=ax)
+    ax.set_title(f"{allele_option}")
+    # plt.xticks(rotation=90)
+    plt.ylabel("") # <- Y-axis title
+    plt.yticks(fontsize=5)
+    plt.xlabel("Normalized T-Score") # <- X-axis title
+    plt.xlim(-3, 3)
+
+    return figure_png(fig)
+
+
+# Rank plot of a phenotype, with the selected allele highlighted
+def _rank_figure(data_sorted, allele_phenotype_option, allele_option):
+    # Scatter plot with error bars
+    fig = rank_figure(data_sorted, allele_phenotype_option, "dataset", highlight=[allele_option])
+
+    fig.add_vline(x=0,  line_width=1, line_dash="dash", line_color="red")
+    # Update layout with labels and title
+    fig.update_layout(
+        title=f"{allele_phenotype_option}",
+        xaxis_title='Sample Mean Distance',
+        yaxis_title='Gene',
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        width=600,
+        height=1200,
+        yaxis=dict(showticklabels=True, dtick=1, tickfont=dict(color='black', size=6), range=[-1,len(data_sorted)]),
+        margin=dict(l=100, r=50, t=100, b=50), # Adjust margins
+        annotations=[
+            dict(
+                text=f'Sample mean distance from wildtype for all strains for selected phenotype: {allele_phenotype_option}. Error bars are 95% CI',
+                xref="paper", yref="paper",
+                x=0, y=-0.2,
+                showarrow=False,
+                font=dict(size=12, color="black")
+            )
+        ]
+    )
+
+    return fig
+
+
 def render(data):
     st.header("Allele-specific Data")
 
@@ -65,22 +167,7 @@ def render(data):
     col3, col4, col7 = st.columns([1, 1, 1])
     col3.subheader('Phenotypic profile')
 
-    # seaborn plot
-    sns.set_context('notebook', font_scale=1)
-    fig, ax = plt.subplots(figsize=(5, 10))
-    ax = sns.barplot(x="T_score", # <- Here we use seaborn as our graphing package.
-                    y="Metric", orient='h', hue="Metric", legend=False,
-                    data=allele_profile_data[allele_profile_data.dataset == f"{allele_option}"],
-                    palette=data["metric_palette"]).set_title(f"{allele_option}")
-    # plt.xticks(rotation=90)
-    plt.ylabel("") # <- Y-axis title
-    plt.yticks(fontsize=5)
-    plt.xlabel("Normalized T-Score") # <- X-axis title
-    plt.xlim(-3, 3)
-
-    # download graph button
-    allele_profile_plot = io.BytesIO()
-    plt.savefig(allele_profile_plot, format='png', dpi=300, bbox_inches='tight')
+    allele_profile_plot = cached_figure(figure_key(data, "allele", "profile png", allele_option), _profile_png, allele_profile_data, allele_option, data["metric_palette"])
     # display image 
     col3.image(allele_profile_plot, width=None, caption=(f'Phenotypic profile of {allele_option}.'))
     # download button for plots
@@ -107,190 +194,58 @@ def render(data):
     # seaborn graph of phenotypic view (sample mean distance) + st.pyplot
 
     data_sorted = data["allele_MSD"].sort_values(by=[f"{allele_phenotype_option}-mean"])
-    allele_colors = ["dimgray"] * len(data_sorted["dataset"])
-    fig = go.Figure()
-
-    # Add scatter plot with error bars
-    for i, row in data_sorted.iterrows():
-        if row['dataset'] == "N2":
-            allele_colors = "red"
-        elif row['dataset'] == allele_option:
-            allele_colors = "magenta"
-        else:
-            allele_colors = "dimgray"
-        fig.add_trace(go.Scatter(
-            x=[row[f"{allele_phenotype_option}-mean"]],
-            y=[row["dataset"]],
-            error_x=dict(
-                type='data',
-                array=[row[f"{allele_phenotype_option}-ci95_hi"] - row[f"{allele_phenotype_option}-mean"]],
-                arrayminus=[row[f"{allele_phenotype_option}-mean"] - row[f"{allele_phenotype_option}-ci95_lo"]],
-                visible=True,
-                color=allele_colors,
-                thickness=3,
-                width=0
-            ),
-            mode='markers',
-            marker=dict(
-                color=allele_colors,
-                size=12,
-                symbol='circle',
-                line=dict(
-                    color='rgb(0,0,0)',
-                    width=1
-                ),
-            ),
-            showlegend=False, # Hide individual points from legend
-            name=""
-        ))
-
-    fig.add_vline(x=0,  line_width=1, line_dash="dash", line_color="red")
-    # Update layout with labels and title
-    fig.update_layout(
-        title=f"{allele_phenotype_option}",
-        xaxis_title='Sample Mean Distance',
-        yaxis_title='Gene',
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        width=600,
-        height=1200,
-        yaxis=dict(showticklabels=True, dtick=1, tickfont=dict(color='black', size=6), range=[-1,len(data_sorted)]),
-        margin=dict(l=100, r=50, t=100, b=50), # Adjust margins
-        annotations=[
-            dict(
-                text=f'Sample mean distance from wildtype for all strains for selected phenotype: {allele_phenotype_option}. Error bars are 95% CI',
-                xref="paper", yref="paper",
-                x=0, y=-0.2,
-                showarrow=False,
-                font=dict(size=12, color="black")
-            )
-        ]
-    )
+    rank_key = figure_key(data, "allele", "rank", allele_phenotype_option, allele_option)
+    fig = cached_figure(rank_key, _rank_figure, data_sorted, allele_phenotype_option, allele_option)
 
-    
-    # recreate matplotlib chart for download button 
-    fig_mpl, ax = plt.subplots(figsize=(6, 12))
-
-    # Loop over each row to plot individual points with error bars
-    for i, row in data_sorted.iterrows():
-        if row['dataset'] == "N2":
-            allele_colors = "red"
-        elif row['dataset'] == allele_option:
-            allele_colors = "magenta"
-        else:
-            allele_colors = "dimgray"
-
-        ax.errorbar(
-            x=row[f"{allele_phenotype_option}-mean"],
-            y=row["dataset"],
-            xerr=[[row[f"{allele_phenotype_option}-mean"] - row[f"{allele_phenotype_option}-ci95_lo"]],
-                [row[f"{allele_phenotype_option}-ci95_hi"] - row[f"{allele_phenotype_option}-mean"]]],
-            fmt='o',
-            color=allele_colors,
-            ecolor=allele_colors,
-            elinewidth=1,
-            capsize=3,
-            markersize=6
-        )
-
-    # Vertical reference line and styling
-    ax.axvline(x=0, color='red', linestyle='--')
-    ax.set_xlabel("Sample Mean Distance")
-    ax.set_ylabel("Gene")
-    ax.set_title(f"{allele_phenotype_option}", fontsize=14)
-    ax.set_yticks(range(len(data_sorted["dataset"])))
-    ax.set_yticklabels(data_sorted["dataset"], fontsize=6)
-    ax.invert_yaxis()
-    plt.tight_layout()
-
-    # Add annotation below chart
-    plt.figtext(
-        0.5, -0.05,
-        f'Sample mean distance from wildtype for all strains for selected phenotype: {allele_phenotype_option}. Error bars are 95% CI',
-        wrap=True, ha='center', fontsize=10
-    )
-
-    # Save to buffer for download
-    allele_phenotype_plot = io.BytesIO()
-    plt.savefig(allele_phenotype_plot, format='png', dpi=300, bbox_inches='tight')
-    allele_phenotype_plot.seek(0)
-    plt.close()
-
-    col4.plotly_chart(fig, use_container_width=True, **{'config': config})
+    with stage("plotly: rank"):
+        col4.plotly_chart(fig, use_container_width=True, **{'config': config})
 
     allele_dat = data_sorted[["dataset", f"{allele_phenotype_option}-mean", f"{allele_phenotype_option}-ci95_lo", f"{allele_phenotype_option}-ci95_hi"]]
     allele_dat.columns = ["gene-allele", f"{allele_phenotype_option}", f"{allele_phenotype_option}-lower", f"{allele_phenotype_option}-upper"]
 
     # Insert download graph button
     col4_1, col4_2 = col4.columns(2)
-    col4_1.download_button(label="Download Plot",
-                            data=allele_phenotype_plot,
-                            file_name=f"{allele_option}_{allele_phenotype_option}_profile.png",
-                            mime="image/png",
-                            key='dnldallelephenotypeprofile')
+    png_download(col4_1, rank_key, _rank_png, (data_sorted, allele_phenotype_option, allele_option),
+                 file_name=f"{allele_option}_{allele_phenotype_option}_profile.png",
+                 key='dnldallelephenotypeprofile')
     col4_2.download_button(label="Download csv",
                             data=convert_df(allele_dat),
                             file_name=f"Allele-specific Data Sample mean distance {allele_phenotype_option}.csv",
                             mime="text/csv",
                             key='dnldallelephenotypeprofilecsv')
 
-    # Habituation Curves 
+    # Habituation curves from the per-tap summary, pooled once per allele
     col7.subheader('Habituation Curves of Response')
 
     with col7:
-
-        metrics = [ "Probability", "Duration", "Speed",
-                   "PSA Speed", 
-                #    "PSA Interval Speed",
-                    "PSA Bias", "PSA Kink", "PSA Crab",
-                    "PSA Aspect Ratio", "PSA Curve"]
-        
-        tabs = st.tabs(metrics)
-
-        for i, metric in enumerate(metrics):
-            with tabs[i]:
-                #  Habituation Plot
-                fig, ax = plt.subplots(figsize=(12, 10))
-                plt.gca().xaxis.grid(False) # gets rid of x-axis markers to make data look clean
-                sns.pointplot(
-                    x="taps", # Here we use seaborn as our graphing package.
-                    y=metric,
-                    data=allele_tap_data_plot,
-                    hue='dataset', # Here we use the extra column from step 6 to separate by group
-                    palette=["black" if gene == "N2" else "darkorange" for gene in allele_tap_data_plot['dataset'].unique()],
-                    errorbar='se' # Confidence interval. 95 = standard error
-                )
-                plt.xlabel("Taps", fontsize='12') # x-axis title
-                plt.ylabel(metric, fontsize='12') # y-axis title
-                plt.title(f"Habituation of Response {metric}", fontsize='16') # figure title
-                plt.ylim(0, 1 if metric == "Probability" else None)
-                ax.legend(loc='upper right', fontsize='12') # legend location
-
-                # download graph button
-                img1 = io.BytesIO()
-                plt.savefig(img1, format='png', dpi=300, bbox_inches='tight')
-                img1.seek(0)
-                # display image
-                tabs[i].image(img1, width=None, caption=f'Habituation of Response {metric}: {allele_option}')
-                # Insert download plot and download csv button
-                col1, col2 = tabs[i].columns(2)
-                col1.download_button("Download Plot", data=img1, file_name=f"{metric} of Tap Habituation {allele_option}.png", mime="image/png", key=f'dnldbtnallele_{i}')
-                col2.download_button("Download csv", data=convert_df(allele_tap_data_plot), file_name=f"Allele-specific Data {allele_option}.csv", mime="text/csv", key=f'dnldbtnallele2_{i}')
+        allele_curves = habituation_curves(data["version"], tuple(sorted(data["datasets"])), "dataset", (allele_option,), data["tap_summary"])
+        palette = {allele: "black" if allele == "N2" else "darkorange" for allele in allele_curves['dataset'].unique()}
+
+        # Only the selected metric is drawn
+        metric = st.radio("Metric", HABITUATION_METRICS, horizontal=True, label_visibility="collapsed", key="allelehabituationmetric")
+        habituation_key = figure_key(data, "allele", "habituation", allele_option, metric)
+        fig = cached_figure(habituation_key, habituation_figure, allele_curves, "dataset", metric, palette)
+        with stage("plotly: habituation"):
+            st.plotly_chart(fig, use_container_width=True, **{'config': config})
+        st.caption(f'Habituation of Response {metric}: {allele_option}')
+        # Insert download plot and download csv button
+        col1, col2 = st.columns(2)
+        png_download(col1, habituation_key, habituation_png, (allele_curves, "dataset", metric, palette),
+                     file_name=f"{metric} of Tap Habituation {allele_option}.png",
+                     key='dnldbtnallele')
+        col2.download_button("Download csv", data=convert_df(allele_tap_data_plot), file_name=f"Allele-specific Data {allele_option}.csv", mime="text/csv", key='dnldbtnallele2')
 
 
     # Create a flag variable
     read_data_flag = False
     if st.button('Read and get Download button for Baseline Data',key='readallelebaseoutcsv'):
         read_data_flag = True
-        st.warning("Please wait, another button will open up to download the data. This might take several minutes ")
+        st.warning("Please wait, another button will open up to download the data.")
 
     # If the button is pressed, read the data and then show show button to download it
     if read_data_flag:
-        baseline_output = read('tap_baseline_data')
-        baseline_output = baseline_output[baseline_output['Screen'].isin(data["datasets"])].replace(["N2_N2", "N2_XJ1"], "N2")
-        # conn.close()
         st.download_button(label="Download raw baseline data",
-                        data=convert_df(baseline_output),
+                        data=fetch_baseline_data(tuple(data["datasets"])),
                         file_name=f"raw_baseline_data.csv",
                         mime="text/csv",
                         key='dnldallelebaseoutcsv')
@@ -16,24 +16,18 @@ from sklearn.decomposition import PCA
 from sklearn.cluster import KMeans
 from sklearn.manifold import TSNE
 import plotly.express as px
+from utils.figure_cache import cached_figure, figure_key
+from utils.profiling import stage
 
 
     
-def render(data):
 
-    st.header("Clustering Genes")
+# Tables from utils.data_loader.fetch_tables() this page uses
+TABLES = ["tap_tstat_data"]
 
-    n_clusters = st.slider(
-        "Select number of clusters",
-        min_value=2,
-        max_value=8,
-        value=6,  # default
-        step=1
-        )
-    
-    # Load data
-    df = data['tap_tstat_data']
 
+# t-SNE map of the genes, colored by k-means cluster
+def _cluster_figure(df, n_clusters):
     gene_names = df['Gene'].values
 
     df = df[~df.isin([np.inf, -np.inf]).any(axis=1)]
@@ -59,14 +53,16 @@ def render(data):
     X = preprocessor.fit_transform(df)
 
     # PCA + KMeans
-    pca = PCA(n_components=99) # optimise 
-    pca_df = pd.DataFrame(pca.fit_transform(X))
-    kmeans = KMeans(n_clusters=n_clusters, n_init='auto', random_state=100)
-    labels = kmeans.fit_predict(pca_df)
+    with stage("clustering: PCA + k-means", rows=len(df)):
+        pca = PCA(n_components=99) # optimise 
+        pca_df = pd.DataFrame(pca.fit_transform(X))
+        kmeans = KMeans(n_clusters=n_clusters, n_init='auto', random_state=100)
+        labels = kmeans.fit_predict(pca_df)
 
     # tSNE to visualise multidimensional data in 2D
-    tsne = TSNE(n_components=2, random_state=100, perplexity=30)
-    tsne_df = pd.DataFrame(tsne.fit_transform(pca_df), columns=['tSNE1', 'tSNE2'])
+    with stage("clustering: t-SNE", rows=len(df)):
+        tsne = TSNE(n_components=2, random_state=100, perplexity=30)
+        tsne_df = pd.DataFrame(tsne.fit_transform(pca_df), columns=['tSNE1', 'tSNE2'])
     tsne_df['Cluster'] = labels.astype(str)
     tsne_df['Gene'] = gene_names
 
@@ -99,4 +95,25 @@ def render(data):
         height=600
     )
 
-    st.plotly_chart(fig, use_container_width=True, config=data["plotly_config"])
+    return fig
+
+
+def render(data):
+
+    st.header("Clustering Genes")
+
+    n_clusters = st.slider(
+        "Select number of clusters",
+        min_value=2,
+        max_value=8,
+        value=6,  # default
+        step=1
+        )
+    
+    # Load data
+    df = data['tap_tstat_data']
+
+    fig = cached_figure(figure_key(data, "clustering", "clusters", n_clusters), _cluster_figure, df, n_clusters)
+
+    with stage("plotly: clusters"):
+        st.plotly_chart(fig, use_container_width=True, config=data["plotly_config"])
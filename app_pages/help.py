@@ -1,5 +1,9 @@
 import streamlit as st
 
+# Tables from utils.data_loader.fetch_tables() this page uses
+TABLES = []
+
+
 def render(data=None):
     st.markdown("""
     ## Home - Getting Started
@@ -1,95 +1,30 @@
 # pages/home.py
 import streamlit as st
-import io
 import plotly.graph_objects as go
 import numpy as np
 from utils.helpers import convert_df, read, transform_tap_tstat_heatmap
+from utils.data_loader import fetch_baseline_summary
+from utils.figure_cache import cached_figure, figure_key
+from utils.plots import bin_rows, cluster_order, figure_png, png_download, rank_figure
+from utils.profiling import stage
 from config import config
 import matplotlib.pyplot as plt
 
-def render(data):
-    st.header('Data at a Glance')
-
-    # Visualisations for data tab
-    col1, col2 = st.columns([4, 5])
-
-    col1.subheader("For A Single Phenotype")
-
-    phenotype_option = col1.selectbox(
-        'Select a phenotype',
-        np.unique(data["phenotype_list"]), key="phenotypeselect")
+# Tables from utils.data_loader.fetch_tables() this page uses
+TABLES = ["gene_MSD", "tap_tstat_data", "tap_tstat_pvalues"]
 
-    data_sorted = data["gene_MSD"].sort_values(by=[f"{phenotype_option}-mean"]).reset_index(drop=True)
-    
-    colors = ["dimgrey"] * len(data_sorted)
+# Genes drawn one per row in the heatmap; taller views are drawn as the means
+# of runs of neighbouring genes until zoomed in
+HEATMAP_MAX_ROWS = 200
 
-    fig = go.Figure()
+# Clustered heatmaps kept in memory across sessions (one per data version and
+# screen selection), and the seconds each is kept
+HEATMAP_CACHE_ENTRIES = 16
+HEATMAP_CACHE_TTL = 3600
 
-    # Add scatter plot with error bars
-    for i, row in data_sorted.iterrows():
-        if row['Gene'] == "N2":
-            colors = "red"
-        else:
-            colors = "dimgray"
-        fig.add_trace(go.Scatter(
-            x=[row[f"{phenotype_option}-mean"]],
-            y=[row["Gene"]],
-            error_x=dict(
-                type='data',
-                array=[row[f"{phenotype_option}-ci95_hi"] - row[f"{phenotype_option}-mean"]],
-                arrayminus=[row[f"{phenotype_option}-mean"] - row[f"{phenotype_option}-ci95_lo"]],
-                visible=True,
-                color=colors,
-                thickness=3,
-                width=0
-            ),
-            mode='markers',
-            marker=dict(
-                color=colors,
-                size=12,
-                symbol='circle',
-                line=dict(
-                    color='rgb(0,0,0)',
-                    width=1
-                ),
-            ),
-            showlegend=False,
-            name=""
-        ))
-    # Add vertical line at 0
-    fig.add_vline(x=0,  line_width=1, line_dash="dash", line_color="red")
-    # Update layout with labels and title
-    fig.update_layout(
-        title={
-            'text': f"{phenotype_option}"},
-        xaxis_title='Sample Mean Distance',
-        yaxis_title='Gene',
-        plot_bgcolor='white',
-        paper_bgcolor='white',
-        font_color="black",
-        width=600,
-        height=800,
-        yaxis=dict(showticklabels=True, 
-                   dtick=1,
-                   tickfont=dict(color='black', size=6), range=[-1,len(data_sorted)]),
-        margin=dict(l=10, r=10, t=40, b=0),
-        annotations=[
-            dict(
-                text=f'Sample mean distance from wildtype for all strains for selected phenotype: {phenotype_option}. Error bars are 95% CI',
-                xref="paper",
-                yref="paper",
-                x=0,
-                y=-0.2,
-                showarrow=False,
-                font=dict(
-                    size=12,
-                    color="black"
-                )
-            )
-        ]
-    )
 
-    # recreate in matplotlib to save static image of the plot
+# Static version of the rank plot for download
+def _rank_png(data_sorted, phenotype_option):
     fig_mpl, ax = plt.subplots(figsize=(6, 10))
     for i, row in data_sorted.iterrows():
         if row['Gene'] == "N2":
@@ -128,39 +63,96 @@ def render(data):
 
     fig_mpl.tight_layout()
 
-    # Save to BytesIO for download
-    phenotype_plot = io.BytesIO()
-    plt.savefig(phenotype_plot, format='png', dpi=300, bbox_inches='tight')
-    phenotype_plot.seek(0)
+    return figure_png(fig_mpl)
 
-    col1.plotly_chart(fig, use_container_width=True, **{'config': config})
 
-    #combine data and rename columns :
-    data_dat = data["gene_MSD"].sort_values(by=[f"{phenotype_option}-mean"])[["Gene", f"{phenotype_option}-mean", f"{phenotype_option}-ci95_lo", f"{phenotype_option}-ci95_hi"]]
-    data_dat.columns = ["Gene", f"{phenotype_option}", f"{phenotype_option}-lower", f"{phenotype_option}-upper"]
+# Static version of the heatmap for download, one row per gene
+def _heatmap_png(heatmap_data):
+    fig2, ax = plt.subplots(figsize=(12, 16))
+    cax = ax.imshow(
+        heatmap_data.values,
+        cmap='RdBu',
+        vmin=-3,
+        vmax=3,
+        aspect='auto'
+    )
+    # Set ticks and labels
+    ax.set_xticks(range(len(heatmap_data.columns)))
+    ax.set_xticklabels(heatmap_data.columns, rotation=90, fontsize=10)
+    ax.set_yticks(range(len(heatmap_data.index)))
+    ax.set_yticklabels(heatmap_data.index, fontsize=6)
+    # Add colorbar
+    cbar = fig2.colorbar(cax, ax=ax)
+    cbar.set_ticks([-3, 0, 3])
+    cbar.set_ticklabels(['-3', '0', '3'])
 
-    # Insert download graph button
-    col1_1, col1_2 = col1.columns(2)
-    col1_1.download_button(label="Download Plot",
-                        data=phenotype_plot,
-                        file_name=f"{phenotype_option}_profile.png",
-                        mime="image/png",
-                        key='dnldphenotypeprofile')
-    col1_2.download_button(label="Download csv",
-                            data=convert_df(data_dat),
-                            file_name=f"Data Glance Sample Mean Distance {phenotype_option}.csv",
-                            mime="text/csv",
-                            key='dnldphenotypeprofilecsv')
+    plt.tight_layout()
+
+    return figure_png(fig2)
 
 
+# Heatmap values, one row per gene, with similar genes next to each other;
+# clustered once per data version and screen selection, which the tables
+# (left unhashed) are determined by; past HEATMAP_CACHE_ENTRIES the least
+# recently used are dropped
+@st.cache_data(max_entries=HEATMAP_CACHE_ENTRIES, ttl=HEATMAP_CACHE_TTL, show_spinner=False)
+def _heatmap_rows(version, datasets, _tap_tstat_data, _tap_tstat_pvalues):
+    heatmap_data = transform_tap_tstat_heatmap(_tap_tstat_data, _tap_tstat_pvalues).set_index("Gene")
+    return heatmap_data.iloc[cluster_order(heatmap_data.values)]
 
-    # Create a heatmap
-    heatmap_data = transform_tap_tstat_heatmap(data["tap_tstat_data"]).set_index("Gene")
+
+# Rank plot of a phenotype
+def _rank_figure(data_sorted, phenotype_option):
+    # Scatter plot with error bars
+    fig = rank_figure(data_sorted, phenotype_option, "Gene")
+
+    # Add vertical line at 0
+    fig.add_vline(x=0,  line_width=1, line_dash="dash", line_color="red")
+    # Update layout with labels and title
+    fig.update_layout(
+        title={
+            'text': f"{phenotype_option}"},
+        xaxis_title='Sample Mean Distance',
+        yaxis_title='Gene',
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font_color="black",
+        width=600,
+        height=800,
+        yaxis=dict(showticklabels=True, 
+                   dtick=1,
+                   tickfont=dict(color='black', size=6), range=[-1,len(data_sorted)]),
+        margin=dict(l=10, r=10, t=40, b=0),
+        annotations=[
+            dict(
+                text=f'Sample mean distance from wildtype for all strains for selected phenotype: {phenotype_option}. Error bars are 95% CI',
+                xref="paper",
+                yref="paper",
+                x=0,
+                y=-0.2,
+                showarrow=False,
+                font=dict(
+                    size=12,
+                    color="black"
+                )
+            )
+        ]
+    )
+
+    return fig
+
+
+# Heatmap of a run of genes, binned down to HEATMAP_MAX_ROWS rows
+def _heatmap_figure(heatmap_data):
+    binned, counts = bin_rows(heatmap_data, HEATMAP_MAX_ROWS)
+    full = len(binned) == len(heatmap_data)
 
     fig = go.Figure(data=go.Heatmap(
-        z=heatmap_data.values,
-        x=heatmap_data.columns,
-        y=heatmap_data.index,
+        z=binned.values,
+        x=binned.columns,
+        y=binned.index,
+        customdata=np.repeat(counts[:, None], len(binned.columns), axis=1),
+        hovertemplate=None if full else "%{y}<br>%{x}: %{z:.2f} (mean of %{customdata} genes)<extra></extra>",
         colorscale='RdBu',
         zmin=-3,
         zmax=3,
@@ -180,72 +172,99 @@ def render(data):
         margin=dict(l=50, r=50, t=50, b=50),
         xaxis_title="",
         yaxis_title="",
+        # Every gene is labelled at full resolution; bins would overlap
         yaxis=dict(showticklabels=True, 
-                   dtick=1,
+                   dtick=1 if full else None,
                    tickfont=dict(color='white', size=6)),
         xaxis=dict(showticklabels=True, 
                    dtick=1,
                    tickfont=dict(color='white', size=12))
     )
 
-    # recreate in matplotlib to save static image of the plot
-    fig2, ax = plt.subplots(figsize=(12, 16))
-    cax = ax.imshow(
-        heatmap_data.values,
-        cmap='RdBu',
-        vmin=-3,
-        vmax=3,
-        aspect='auto'
-    )
-    # Set ticks and labels
-    ax.set_xticks(range(len(heatmap_data.columns)))
-    ax.set_xticklabels(heatmap_data.columns, rotation=90, fontsize=10)
-    ax.set_yticks(range(len(heatmap_data.index)))
-    ax.set_yticklabels(heatmap_data.index, fontsize=6)
-    # Add colorbar
-    cbar = fig2.colorbar(cax, ax=ax)
-    cbar.set_ticks([-3, 0, 3])
-    cbar.set_ticklabels(['-3', '0', '3'])
+    return fig
 
-    # Save to BytesIO
-    imgheatmap = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(imgheatmap, format="png", dpi=300, bbox_inches='tight')
-    imgheatmap.seek(0)
 
-    # Display the heatmap in Streamlit
+def render(data):
+    st.header('Data at a Glance')
+
+    # Visualisations for data tab
+    col1, col2 = st.columns([4, 5])
+
+    col1.subheader("For A Single Phenotype")
+
+    phenotype_option = col1.selectbox(
+        'Select a phenotype',
+        np.unique(data["phenotype_list"]), key="phenotypeselect")
+
+    data_sorted = data["gene_MSD"].sort_values(by=[f"{phenotype_option}-mean"]).reset_index(drop=True)
+    
+    rank_key = figure_key(data, "home", "rank", phenotype_option)
+    fig = cached_figure(rank_key, _rank_figure, data_sorted, phenotype_option)
+
+    with stage("plotly: rank"):
+        col1.plotly_chart(fig, use_container_width=True, **{'config': config})
+
+    #combine data and rename columns :
+    data_dat = data["gene_MSD"].sort_values(by=[f"{phenotype_option}-mean"])[["Gene", f"{phenotype_option}-mean", f"{phenotype_option}-ci95_lo", f"{phenotype_option}-ci95_hi"]]
+    data_dat.columns = ["Gene", f"{phenotype_option}", f"{phenotype_option}-lower", f"{phenotype_option}-upper"]
+
+    # Insert download graph button
+    col1_1, col1_2 = col1.columns(2)
+    png_download(col1_1, rank_key, _rank_png, (data_sorted, phenotype_option),
+                 file_name=f"{phenotype_option}_profile.png",
+                 key='dnldphenotypeprofile')
+    col1_2.download_button(label="Download csv",
+                            data=convert_df(data_dat),
+                            file_name=f"Data Glance Sample Mean Distance {phenotype_option}.csv",
+                            mime="text/csv",
+                            key='dnldphenotypeprofilecsv')
+
+
+
+    # Create a heatmap of the genes in clustered order, clustered once per database version
     col2.subheader("Comprehensive Heatmap of Entire Dataset")
-    col2.plotly_chart(fig, use_container_width=True, **{'config': config})
+    heatmap_data = _heatmap_rows(data["version"], tuple(sorted(data["datasets"])),
+                                 data["tap_tstat_data"], data["tap_tstat_pvalues"])
+
+    genes = heatmap_data.index.tolist()
+    lo, hi = 0, len(genes) - 1
+    if len(genes) > HEATMAP_MAX_ROWS:
+        lo, hi = col2.select_slider("Zoom to genes", options=range(len(genes)), value=(lo, hi),
+                                    format_func=lambda i: genes[i], key="heatmapzoom")
+    window = heatmap_data.iloc[lo:hi + 1]
+
+    heatmap_key = figure_key(data, "home", "heatmap", lo, hi)
+    fig = cached_figure(heatmap_key, _heatmap_figure, window)
+
+    # Display the heatmap in Streamlit
+    with stage("plotly: heatmap"):
+        col2.plotly_chart(fig, use_container_width=True, **{'config': config})
+    if len(window) > HEATMAP_MAX_ROWS:
+        col2.caption(f"{len(window)} genes shown as {HEATMAP_MAX_ROWS} rows, each the mean of neighbouring "
+                     "genes; zoom in to a range of genes to see them one per row.")
 
     col2_1, col2_2 = col2.columns(2)
-    col2_1.download_button(label="Download Plot",
-                        data=imgheatmap,
-                        file_name="Heatmap.png",
-                        mime="image/png",
-                        key='dnldheatmap')
-    # Add download buttons    
+    png_download(col2_1, heatmap_key, _heatmap_png, (window,),
+                 file_name="Heatmap.png",
+                 key='dnldheatmap')
+    # Add download buttons; the CSV holds the genes shown, in the order shown
     col2_2.download_button(
         label="Download CSV",
-        data=convert_df(data["tap_tstat_data"]),
+        data=convert_df(window.reset_index()),
         file_name="Data_Glance_Heatmap.csv",
         mime="text/csv",
         key='dnldheatmapcsv'
     )
 
-#  Button to download baseline data - this is commented out for now as the file is quite large and takes a long time to load, but can be uncommented if needed in the future.
-    # # Create a flag variable
-    # read_data_flag = False
-    # if st.button('Read and get Download button for Baseline Data',key='readbaseoutcsv'):
-    #     read_data_flag = True
-    #     st.warning("Please wait, another button will open up to download the data. This might take several minutes ")
-
-    # # If the button is pressed, read the data and then show show button to download it
-    # if read_data_flag:
-    #     baseline_output = read('tap_baseline_data')
-    #     baseline_output = baseline_output[baseline_output['Screen'].isin(data["datasets"])].replace(["N2_N2", "N2_XJ1"], "N2")
-
-    #     st.download_button(label="Download raw baseline data",
-    #                     data=convert_df(baseline_output),
-    #                     file_name=f"raw_baseline_data.csv",
-    #                     mime="text/csv",
-    #                     key='dnldbaseoutcsv')
+    # Per-plate baseline summary; the raw baseline table is too large to offer here
+    read_data_flag = False
+    if st.button('Read and get Download button for Baseline Summary', key='readbasesummarycsv'):
+        read_data_flag = True
+
+    # If the button is pressed, read the data and then show show button to download it
+    if read_data_flag:
+        st.download_button(label="Download baseline summary (per plate)",
+                        data=convert_df(fetch_baseline_summary(tuple(sorted(data["datasets"])))),
+                        file_name="baseline_summary_per_plate.csv",
+                        mime="text/csv",
+                        key='dnldbasesummarycsv')
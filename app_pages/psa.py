@@ -6,34 +6,16 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 from utils.helpers import convert_df, read
+from utils.figure_cache import cached_figure, figure_key
+from utils.plots import figure_png
 from config import config
 
+# Tables from utils.data_loader.fetch_tables() this page uses
+TABLES = ["psa_output"]
 
-def render(data):
-    st.header("Post Stimulus Arousal Data")
-
-    psa_df = data["psa_output"]
-
-    # Filter boxes for metric and summary
-    metric_option = st.selectbox("Select metric", ['Speed', 'Bias', 'Angular Speed', 'Kink', 'Crab', 'Aspect Ratio', 'Curve'])
-    summary_option = st.selectbox("Select summary", ['Initial', 'Final', 'Recovery', 'Peak', 'Peak Tap Number', 'Average', 'Sensitization', 'Habituation', 'Spontaneous Recovery', 'Memory Retention'])
-
-    # Filter box for gene
-    gene_options = sorted(psa_df["Gene"].unique())
-    selected_genes = st.multiselect("Select Genes", gene_options, default=gene_options)
-    filtered_df = psa_df[psa_df["Gene"].isin(selected_genes)]
 
-    # sort by gene
-    gene_order = (
-    psa_df.groupby("Gene")[f"{summary_option} PSA {metric_option}"]
-    .mean()
-    .sort_values()
-    .index
-    )
-
-    # Plot
-    st.subheader(f"Full Post-Stimulus Arousal Response — {metric_option}")
-    
+# Bar plot of a PSA summary for each gene
+def _barplot_png(filtered_df, gene_order, metric_option, summary_option):
     fig, ax = plt.subplots(figsize=(15, 5))
     sns.set_context("poster")
     sns.barplot(
@@ -64,7 +46,38 @@ def render(data):
     plt.xticks(rotation=90, fontsize=10)
     plt.yticks(fontsize=12)
     # ax.set_ylim(top=0.33)
-    st.pyplot(fig)
+
+    return figure_png(fig)
+
+
+def render(data):
+    st.header("Post Stimulus Arousal Data")
+
+    psa_df = data["psa_output"]
+
+    # Filter boxes for metric and summary
+    metric_option = st.selectbox("Select metric", ['Speed', 'Bias', 'Angular Speed', 'Kink', 'Crab', 'Aspect Ratio', 'Curve'])
+    summary_option = st.selectbox("Select summary", ['Initial', 'Final', 'Recovery', 'Peak', 'Peak Tap Number', 'Average', 'Sensitization', 'Habituation', 'Spontaneous Recovery', 'Memory Retention'])
+
+    # Filter box for gene
+    gene_options = sorted(psa_df["Gene"].unique())
+    selected_genes = st.multiselect("Select Genes", gene_options, default=gene_options)
+    filtered_df = psa_df[psa_df["Gene"].isin(selected_genes)].astype({"Gene": object})  # seaborn draws every category of a categorical hue
+
+    # sort by gene
+    gene_order = (
+    psa_df.groupby("Gene", observed=True)[f"{summary_option} PSA {metric_option}"]
+    .mean()
+    .sort_values()
+    .index
+    )
+
+    # Plot
+    st.subheader(f"Full Post-Stimulus Arousal Response — {metric_option}")
+    
+    png = cached_figure(figure_key(data, "psa", "barplot png", metric_option, summary_option, selected_genes),
+                        _barplot_png, filtered_df, gene_order, metric_option, summary_option)
+    st.image(png, use_container_width=True)
 
 
 
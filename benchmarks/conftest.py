@@ -0,0 +1,82 @@
+# benchmarks/conftest.py
+#
+# Fixtures of the data-layer benchmarks: synthetic tables at each scale, a
+# stand-in pool serving them from memory and, when MWT_BENCH_DSN is set, a
+# connection pool on a PostgreSQL schema holding them.
+import contextlib
+import os
+import psycopg
+import pytest
+from psycopg_pool import ConnectionPool
+from utils import data_loader
+from utils.synthetic import load_synthetic, synthetic_tables
+
+# Scale name -> synthetic_tables() arguments
+SCALES = {
+    "small": dict(n_screens=3, n_genes=40, n_plates=3),
+    "medium": dict(n_screens=8, n_genes=150, n_plates=3),
+    "large": dict(n_screens=20, n_genes=400, n_plates=4),
+}
+
+# Scales to run, e.g. MWT_BENCH_SCALES=small,medium,large
+BENCH_SCALES = os.environ.get("MWT_BENCH_SCALES", "small,medium").split(",")
+
+# libpq connection string of a scratch database for the loading benchmarks;
+# the tables are written to one "mwt_bench_<scale>" schema per scale
+BENCH_DSN = os.environ.get("MWT_BENCH_DSN")
+
+
+@pytest.fixture(scope="session", params=BENCH_SCALES)
+def scale(request):
+    return request.param
+
+
+@pytest.fixture(scope="session")
+def tables(scale):
+    return synthetic_tables(**SCALES[scale])
+
+
+@pytest.fixture(scope="session")
+def small_tables():
+    # One scale is enough to check results against the references
+    return synthetic_tables(**SCALES["small"])
+
+
+@pytest.fixture(scope="session")
+def pair_tables(scale):
+    # Older tstat tables, with "(tstat, p)" text cells
+    return synthetic_tables(**SCALES[scale], tstat_format="pairs")
+
+
+@pytest.fixture(scope="session")
+def pool(scale, tables):
+    if not BENCH_DSN:
+        pytest.skip("set MWT_BENCH_DSN to benchmark loading from PostgreSQL")
+
+    schema = f"mwt_bench_{scale}"
+    with psycopg.connect(BENCH_DSN) as connection:
+        load_synthetic(connection, tables, schema)
+
+    with ConnectionPool(BENCH_DSN, kwargs={"options": f"-c search_path={schema}"}, min_size=1, max_size=8) as pool:
+        yield pool
+
+
+class _OfflinePool:
+    # Hands out no connection; reads are served by the offline_pool fixture
+    @contextlib.contextmanager
+    def connection(self):
+        yield None
+
+
+@pytest.fixture
+def offline_pool(tables, monkeypatch):
+    # The loaders with read() served from the synthetic tables and no
+    # materialized tables, so their own work is timed without a database
+    def read(table, connection, columns=None, where=None, params=None):
+        assert where is None, "offline reads are full-table only"
+        df = tables[table]
+        return (df if columns is None else df[columns]).copy()
+
+    monkeypatch.setattr(data_loader, "read", read)
+    monkeypatch.setattr(data_loader, "is_current", lambda connection, source, tables: False)
+    return _OfflinePool()
@@ -0,0 +1,85 @@
+# benchmarks/test_data_layer.py
+#
+# Load and aggregation times of the data layer on synthetic data, per scale:
+#
+#     python -m pytest benchmarks --benchmark-autosave
+#     python -m pytest benchmarks --benchmark-compare
+#
+# The loading benchmarks read from PostgreSQL when MWT_BENCH_DSN is set (see
+# conftest.py) and are skipped without it; their offline variants read the
+# synthetic tables from memory, timing everything but the download.
+# st.cache_data is cleared before every round, so cached helpers are timed
+# computing, not hashing their inputs.
+import pytest
+import streamlit as st
+from utils.data_loader import (
+    CONTROL_IDS, SOURCE_LOADERS, TSTAT_SOURCES, build_data, load_source, normalize_tstat, subtract_by_control,
+)
+from utils.helpers import aggregate_unique_values, aggregate_unique_values_MSD, split_tstat_pairs
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("source", ["tstat_gene_data", "tstat_allele_data"])
+def test_split_tstat_pairs(benchmark, tables, source):
+    id_col = TSTAT_SOURCES[source][0]
+    tstat, pvalue = benchmark(split_tstat_pairs, tables[source], [id_col, "Screen"])
+    assert tstat.shape == pvalue.shape
+
+
+def test_split_tstat_pairs_text(benchmark, pair_tables):
+    # Older tables, with "(tstat, p)" text cells parsed one by one
+    df = pair_tables["tstat_gene_data"]
+    tstat, _ = benchmark(split_tstat_pairs, df, ["Gene", "Screen"])
+    assert tstat.select_dtypes("number").shape[1] == df.shape[1] - 2
+
+
+@pytest.mark.parametrize("source", ["tstat_gene_data", "tstat_allele_data"])
+def test_aggregate_unique_values(benchmark, tables, source):
+    id_col = TSTAT_SOURCES[source][0]
+    tstat, _ = split_tstat_pairs(tables[source], [id_col, "Screen"])
+    grouped = benchmark(aggregate_unique_values.__wrapped__, tstat, [id_col])
+    assert len(grouped) == tstat[id_col].nunique()
+
+
+@pytest.mark.parametrize("table, id_col", [("gene_MSD", "Gene"), ("allele_MSD", "dataset")])
+def test_aggregate_unique_values_MSD(benchmark, tables, table, id_col):
+    grouped = benchmark(aggregate_unique_values_MSD.__wrapped__, tables[table], [id_col])
+    assert len(grouped) == tables[table][id_col].nunique()
+
+
+def test_subtract_by_control(benchmark, tables):
+    tstat, _ = split_tstat_pairs(tables["tstat_gene_data"], ["Gene", "Screen"])
+    numeric_cols = tstat.select_dtypes("number").columns
+    result = benchmark(subtract_by_control, tstat, id_col="Gene", control_id=CONTROL_IDS, numeric_cols=numeric_cols)
+    assert result.shape == tstat.shape
+
+
+@pytest.mark.parametrize("source", list(TSTAT_SOURCES))
+def test_normalize_tstat(benchmark, tables, source):
+    id_col, profile_columns, _ = TSTAT_SOURCES[source]
+    tap_tstat, profile, pvalues = benchmark(normalize_tstat, tables[source], id_col, profile_columns)
+    assert tap_tstat.shape == pvalues.shape
+
+
+@pytest.mark.parametrize("source", list(SOURCE_LOADERS))
+def test_load_source(benchmark, pool, source):
+    loaded = benchmark.pedantic(load_source, args=(pool, source), setup=st.cache_data.clear, rounds=3)
+    assert all(len(df) for df in loaded.values())
+
+
+def test_build_data(benchmark, pool, tables):
+    # What fetch_data() runs on a cold cache without a snapshot
+    data = benchmark.pedantic(build_data, args=(pool,), setup=st.cache_data.clear, rounds=3)
+    assert len(data["tap_output"]) == len(tables["tap_response_data"])
+
+
+@pytest.mark.parametrize("source", list(SOURCE_LOADERS))
+def test_load_source_offline(benchmark, offline_pool, source):
+    loaded = benchmark.pedantic(load_source, args=(offline_pool, source), setup=st.cache_data.clear, rounds=3)
+    assert all(len(df) for df in loaded.values())
+
+
+def test_build_data_offline(benchmark, offline_pool, tables):
+    data = benchmark.pedantic(build_data, args=(offline_pool,), setup=st.cache_data.clear, rounds=3)
+    assert len(data["tap_output"]) == len(tables["tap_response_data"])
@@ -0,0 +1,130 @@
+# benchmarks/test_parity.py
+#
+# Checks the vectorised data-layer functions against straightforward
+# reference implementations on the small synthetic tables, so the benchmarks
+# in test_data_layer.py only ever time code that gives the same answers:
+#
+#     python -m pytest benchmarks/test_parity.py
+#
+# The references are the per-group versions the dashboard used before, or
+# plain groupbys over the rows a summary was built from.
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from utils.data_loader import BASELINE_KEYS, CONTROL_IDS, rebin_baseline, subtract_by_control
+from utils.helpers import aggregate_unique_values_MSD, pool_taps, split_tstat_pairs, summarise_taps
+
+
+# aggregate_unique_values_MSD() one group at a time, as first written
+def _reference_MSD(df, by):
+    agg_cols = [col for col in df.columns if col not in by + ['Screen']]
+
+    def _aggregate_group(group):
+        values = {}
+        for col in agg_cols:
+            if '-mean' in col or '-sem' in col:
+                count_col = col.replace('-mean', '-count').replace('-sem', '-count')
+                if count_col not in group.columns or not group[count_col].sum():
+                    values[col] = np.nan
+                elif '-mean' in col:
+                    values[col] = (group[col] * group[count_col]).sum() / group[count_col].sum()
+                else:
+                    values[col] = np.sqrt((group[col] ** 2 * group[count_col]).sum() / group[count_col].sum())
+            elif '-count' in col:
+                values[col] = group[col].sum()
+            else:
+                values[col] = np.nan
+        return pd.Series(values)
+
+    grouped = df.groupby(by).apply(_aggregate_group, include_groups=False).reset_index()
+    columns = {col: grouped[col] for col in grouped.columns}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for col in [col for col in grouped.columns if '-mean' in col]:
+            sem_col, count_col = col.replace('-mean', '-sem'), col.replace('-mean', '-count')
+            if sem_col in grouped.columns and count_col in grouped.columns:
+                half_width = 1.96 * grouped[sem_col] / np.sqrt(grouped[count_col])
+                columns[col.replace('-mean', '-ci95_lo')] = grouped[col] - half_width
+                columns[col.replace('-mean', '-ci95_hi')] = grouped[col] + half_width
+    columns['Screen'] = df.groupby(by)['Screen'].apply(lambda x: list(set(x))).reset_index(drop=True)
+    return pd.DataFrame(columns)
+
+
+# subtract_by_control() one screen at a time, as first written
+def _reference_subtract(df, id_col, control_ids, numeric_cols):
+    def subtract_control(group):
+        for control_id in control_ids:
+            control = group[group[id_col] == control_id]
+            if not control.empty:
+                group = group.copy()
+                group[numeric_cols] = group[numeric_cols] - control[numeric_cols].iloc[0]
+                break
+        return group
+
+    return pd.concat([subtract_control(group) for _, group in df.groupby("Screen")])
+
+
+# Mean, sem and count of `metrics` per group of rows, in the summary tables' layout
+def _reference_summary(rows, keys, metrics):
+    grouped = rows.groupby(keys, dropna=False)[metrics]
+    stats = {"mean": grouped.mean(), "sem": grouped.sem(), "count": grouped.count()}
+    return pd.concat(
+        {f"{metric}-{stat}": stats[stat][metric] for metric in metrics for stat in stats}, axis=1
+    ).reset_index()
+
+
+@pytest.mark.parametrize("table, id_col", [("gene_MSD", "Gene"), ("allele_MSD", "dataset")])
+def test_aggregate_unique_values_MSD(small_tables, table, id_col):
+    grouped = aggregate_unique_values_MSD(small_tables[table], [id_col])
+    expected = _reference_MSD(small_tables[table], [id_col])
+    for df in (grouped, expected):
+        df['Screen'] = df['Screen'].map(sorted)
+    # Groups are summed in a different order, so sums can differ in the last bit
+    assert_frame_equal(grouped, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("control_id", ["N2", CONTROL_IDS])
+def test_subtract_by_control(small_tables, control_id):
+    tstat, _ = split_tstat_pairs(small_tables["tstat_gene_data"], ["Gene", "Screen"])
+    numeric_cols = list(tstat.select_dtypes("number").columns)
+    control_ids = [control_id] if isinstance(control_id, str) else list(control_id)
+    result = subtract_by_control(tstat, id_col="Gene", control_id=control_id, numeric_cols=numeric_cols)
+    expected = _reference_subtract(tstat, "Gene", control_ids, numeric_cols)
+    assert_frame_equal(result, expected.loc[result.index])
+
+
+@pytest.mark.parametrize("id_col", ["Gene", "dataset"])
+def test_pool_taps(small_tables, id_col):
+    tap_output = small_tables["tap_response_data"]
+    ids = [value for value in pd.unique(tap_output[id_col]) if not value.startswith("N2")][:3]
+    curves = pool_taps(summarise_taps(tap_output), id_col, ids)
+
+    # The same curves straight from the plate rows
+    dates = tap_output.loc[tap_output[id_col].isin(ids), "Date"].unique()
+    rows = tap_output[tap_output["Date"].isin(dates) & tap_output[id_col].isin(["N2", *ids])].dropna(subset=["taps"])
+    metrics = [col[:-len("-mean")] for col in curves.columns if col.endswith("-mean")]
+    expected = _reference_summary(rows, [id_col, "taps"], metrics)
+
+    keys = [id_col, "taps"]
+    assert_frame_equal(
+        curves.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True),
+        check_dtype=False, rtol=1e-9,
+    )
+
+
+@pytest.mark.parametrize("resolution", [2, 10, None])
+def test_rebin_baseline(small_tables, resolution):
+    raw = small_tables["tap_baseline_data"]
+    metrics = [col for col in raw.select_dtypes("number").columns if col != "Time"]
+    per_second = _reference_summary(raw.assign(Time=np.floor(raw["Time"])), BASELINE_KEYS + ["Time"], metrics)
+    rebinned = rebin_baseline(per_second, resolution)
+
+    keys = BASELINE_KEYS if resolution is None else BASELINE_KEYS + ["Time"]
+    rows = raw if resolution is None else raw.assign(Time=np.floor(raw["Time"] / resolution) * resolution)
+    expected = _reference_summary(rows, keys, metrics)
+    assert_frame_equal(
+        rebinned.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True),
+        check_dtype=False, rtol=1e-9,
+    )
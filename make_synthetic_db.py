@@ -0,0 +1,59 @@
+# make_synthetic_db.py
+#
+# Writes a synthetic MWT database (see utils/synthetic.py) into its own schema,
+# for benchmarks and for running the dashboard without the production data.
+# Uses the same database.ini as materialize_tables.py (see example_database.ini):
+#
+#     python make_synthetic_db.py --screens 10 --genes 200 --plates 3 --schema synthetic
+#
+# Tables in the target schema are replaced, so the schema must not be the one
+# holding the real data.
+import argparse
+import sys
+import psycopg
+from backend_config import load_config
+from utils.synthetic import load_synthetic, synthetic_tables
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic MWT database.")
+    parser.add_argument("--screens", type=int, default=3, help="number of screens")
+    parser.add_argument("--genes", type=int, default=40, help="number of genes (each screen tests half)")
+    parser.add_argument("--plates", type=int, default=3, help="plates per strain and screen")
+    parser.add_argument("--alleles", type=int, default=2, help="alleles per gene")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--pairs", action="store_true", help='write tstat cells as "(tstat, p)" text, as before Step4 split them')
+    parser.add_argument("--schema", default="synthetic", help="schema to write to (default: synthetic)")
+    args = parser.parse_args()
+
+    if args.schema == "public":
+        print("Refusing to write synthetic tables into the public schema.")
+        sys.exit(1)
+
+    config = load_config()
+    if (config['user'] == "" or config['password'] == ""):
+        print("Please set your user and password in the database.ini file.")
+        sys.exit(1)
+
+    tables = synthetic_tables(
+        n_screens=args.screens,
+        n_genes=args.genes,
+        n_plates=args.plates,
+        alleles_per_gene=args.alleles,
+        seed=args.seed,
+        tstat_format="pairs" if args.pairs else "columns",
+    )
+
+    with psycopg.connect(
+        dbname=config['database'],
+        user=config['user'],
+        password=config['password'],
+        host=config['host'],
+        port=config['port']
+        ) as connection:
+
+        load_synthetic(connection, tables, args.schema)
+
+    for name, df in tables.items():
+        print(f"wrote {args.schema}.{name}: {len(df)} rows")
+
+    print("---------- DONE ----------")
@@ -0,0 +1,45 @@
+# materialize_tables.py
+#
+# Writes the normalised tstat and profile tables and the baseline summary
+# tables that the dashboard reads, after logging the per-screen row counts of
+# the source tables (see utils.snapshot.record_load).
+# Run from the repository root after new screens are uploaded with the Step4
+# notebook, using the same database.ini (see example_database.ini):
+#
+#     python materialize_tables.py
+#
+# Tstat tables that still hold (tstat, p-value) pairs in single columns are
+# converted to "<metric>" and "<metric> q" float columns first with:
+#
+#     python materialize_tables.py --upgrade-tstat
+import sys
+import psycopg
+from backend_config import load_config
+from utils.data_loader import BASELINE_TABLE, materialize_baseline, materialize_tstat, upgrade_tstat_schema
+from utils.snapshot import SOURCE_TABLES, record_load
+
+if __name__ == '__main__':
+    config = load_config()
+    if (config['user'] == "" or config['password'] == ""):
+        print("Please set your user and password in the database.ini file.")
+        sys.exit(1)
+
+    with psycopg.connect(
+        dbname=config['database'],
+        user=config['user'],
+        password=config['password'],
+        host=config['host'],
+        port=config['port']
+        ) as connection:
+
+        if "--upgrade-tstat" in sys.argv[1:]:
+            for table in upgrade_tstat_schema(connection):
+                print(f"upgraded {table}")
+
+        record_load(connection, SOURCE_TABLES + [BASELINE_TABLE])
+        print("logged row counts")
+
+        for table in materialize_tstat(connection) + materialize_baseline(connection):
+            print(f"wrote {table}")
+
+    print("---------- DONE ----------")
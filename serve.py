@@ -0,0 +1,17 @@
+# serve.py
+#
+# Starts the dashboard with its caches warmed in the same process: every table
+# is loaded in a background thread while Streamlit starts, so the first users
+# find them in memory. Progress goes to the readiness report (.snapshots/ready.json,
+# override with MWT_READY_FILE), which the Docker HEALTHCHECK waits on.
+# Run from the repository root; arguments are passed on to `streamlit run`:
+#
+#     python serve.py --server.port=8502
+import sys
+from streamlit.web import cli
+from utils.warmup import start_warmup
+
+if __name__ == '__main__':
+    start_warmup()
+    sys.argv = ["streamlit", "run", "MWT_dashboard.py", *sys.argv[1:]]
+    sys.exit(cli.main())
@@ -4,8 +4,11 @@ import streamlit as st
 
 def check_password():
     def password_entered():
-        if st.session_state["password"] == st.secrets["password"]:
+        # The optional admin password also unlocks the admin-only panels
+        is_admin = "admin_password" in st.secrets and st.session_state["password"] == st.secrets["admin_password"]
+        if st.session_state["password"] == st.secrets["password"] or is_admin:
             st.session_state["password_correct"] = True
+            st.session_state["is_admin"] = is_admin
             del st.session_state["password"]
         else:
             st.session_state["password_correct"] = False
@@ -19,3 +22,8 @@ def check_password():
         return False
     else:
         return True
+
+
+def is_admin():
+    # True for sessions that logged in with the admin password
+    return st.session_state.get("is_admin", False)
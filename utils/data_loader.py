@@ -1,19 +1,41 @@
 # utils/fetch_data.py
-import psycopg
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import numpy as np
 import pandas as pd
-from utils.helpers import read, aggregate_unique_values, aggregate_unique_values_MSD
+from psycopg import sql
+from utils.db import get_pool
+from utils.dtypes import compact_dtypes, memory_report
+from utils.helpers import read, aggregate_unique_values, aggregate_unique_values_MSD, split_tstat_pairs, summarise_taps, PVALUE_SUFFIX
+from utils.materialize import is_current, materialized_version, write_query, write_table
+from utils.preprocess import N2_ALIASES, dataset_view, phenotype_names, replace_controls
+from utils.profiling import profiled
+from utils.snapshot import database_version, load_snapshot, marks_version, save_snapshot, screen_marks
+
+logger = logging.getLogger(__name__)
 
 
 def subtract_by_control(df, id_col, control_id="N2", screen_col="Screen", numeric_cols=None):
     """
     Subtracts values from control row (e.g., N2) within each screen group.
+
+    The control rows are collected into one lookup table indexed by screen,
+    aligned to the rows with a reindex and subtracted in a single broadcast.
+    When several control ids are given, each screen uses the first one (in the
+    given order) that it contains. Screens without a control row are left
+    unchanged.
     
     Parameters:
         df (pd.DataFrame): Input dataframe
         id_col (str): Column to identify control row (e.g., "dataset" or "Gene")
-        control_id (str): Value of the control (e.g., "N2" or "N2_XJ1")
+        control_id (str or list of str): Value(s) of the control, in order of
+                                         preference (e.g., ["N2", "N2_XJ1", "N2_N2"])
         screen_col (str): Column representing the screen (e.g., "Screen")
         numeric_cols (list): List of numeric columns to normalize
         
@@ -22,28 +44,60 @@ def subtract_by_control(df, id_col, control_id="N2", screen_col="Screen", numeri
     """
     if numeric_cols is None:
         numeric_cols = df.select_dtypes(include=np.number).columns
+    numeric_cols = list(numeric_cols)
+    control_ids = [control_id] if isinstance(control_id, str) else list(control_id)
+
+    # One control row per screen: the preferred control id, first occurrence
+    controls = df[df[id_col].isin(control_ids)]
+    preference = controls[id_col].map({control: rank for rank, control in enumerate(control_ids)})
+    controls = controls.iloc[np.argsort(preference.to_numpy(), kind="stable")].drop_duplicates(screen_col)
+    lookup = controls.set_index(screen_col)[numeric_cols]
+
+    df = df.copy()
+    has_control = df[screen_col].isin(lookup.index).to_numpy()
+    offsets = lookup.reindex(df.loc[has_control, screen_col]).to_numpy()
+    df.loc[has_control, numeric_cols] = df.loc[has_control, numeric_cols].to_numpy() - offsets
+
+    return df
 
-    def subtract_control(group):
-        control = group[group[id_col] == control_id]
-        if control.empty:
-            return group  
-        control_row = control.iloc[0][numeric_cols]
-        group[numeric_cols] = group[numeric_cols] - control_row
-        return group
 
-    return df.groupby(screen_col, group_keys=False).apply(subtract_control)
+# Control strain names used across screens, in order of preference
+CONTROL_IDS = ["N2", "N2_XJ1", "N2_N2"]
+
+
+def fetch_screens():
+    """
+    Lists the screens available in the database, for the dataset selector.
+    Follows fetch_marks(), so an uploaded screen appears within a minute.
+
+    Returns:
+        list of str: Sorted screen names
+    """
+    return sorted(screen for screen in fetch_marks()["gene_MSD"]["screens"] if screen is not None)
 
 
-@st.cache_data
-def fetch_data():
+@profiled("fetch_data")
+def fetch_data(screens=None):
     """
-    Connects to PostgreSQL database and loads all necessary tables for the dashboard.
+    Loads all tables for the dashboard.
+
+    With `screens`, only rows belonging to those screens are read from the
+    database, and each selection is cached separately. Pass a sorted tuple so
+    the same selection always hits the same cache entry. Tables are served by
+    fetch_source(), so the snapshot of each source's current version is used
+    when present, and screens uploaded later are merged in incrementally.
+
+    Inputs:
+        screens (tuple of str): Screens to load (default: all screens)
     
     Returns:
         pd.DataFrame: Contains:
                         - tap_output
+                        - tap_summary
                         - tap_tstat_allele
                         - tap_tstat_data
+                        - tap_tstat_allele_pvalues
+                        - tap_tstat_pvalues
                         - gene_profile_data
                         - allele_profile_data
                         - gene_MSD
@@ -51,202 +105,1139 @@ def fetch_data():
                         - psa_output
                         - id_data
     """
-    with psycopg.connect(
-        dbname="mwtdata", 
-        user=st.secrets["psql_user"], 
-        password=st.secrets["psql_passwword"], 
-        # host="rds-mwt-data.ctie02ksmcqc.ca-central-1.rds.amazonaws.com", 
-        host="142.103.210.25",
-        port=5432
-        ) as connection:
-        
-        # ------- Read data from PostgreSQL database -----------
-        listofgenecolumns = ['Gene', 'Screen', 'Morphwidth', 'Midline', 'Area', 'Speed',
-                            'Angular Speed', 'Bias', 'Aspect Ratio', 'Kink', 'Curve', 'Crab',
-                            'Pathlength', 'Initial Response Duration',
-                            'Initial Response Probability', 'Initial Response Speed',
-                            'Initial PSA Speed', 'Initial PSA Bias', 'Initial PSA Angular Speed',
-                            'Initial PSA Aspect Ratio', 'Initial PSA Kink', 'Initial PSA Curve',
-                            'Initial PSA Crab', 
-                            'Final Response Duration', 'Final Response Probability',
-                            'Final Response Speed', 'Final PSA Speed', 'Final PSA Bias',
-                            'Final PSA Angular Speed', 'Final PSA Aspect Ratio', 'Final PSA Kink',
-                            'Final PSA Curve', 'Final PSA Crab',
-                            'Peak PSA Speed', 'Peak PSA Bias', 'Peak PSA Angular Speed',
-                            'Peak PSA Aspect Ratio', 'Peak PSA Kink', 'Peak PSA Curve', 'Peak PSA Crab',
-                            'Peak Tap Number of PSA Speed', 'Peak Tap Number of PSA Bias', 
-                            'Peak Tap Number of PSA Angular Speed', 'Peak Tap Number of PSA Aspect Ratio',
-                            'Peak Tap Number of PSA Kink', 'Peak Tap Number of PSA Curve', 'Peak Tap Number of PSA Crab',
-                            'Average PSA Speed', 'Average PSA Bias', 'Average PSA Angular Speed',
-                            'Average PSA Aspect Ratio', 'Average PSA Kink', 'Average PSA Curve', 
-                            'Average PSA Crab', 
-                            'Habituation of Response Duration',
-                            'Habituation of Response Probability', 'Habituation of Response Speed',
-                            'Habituation of PSA Speed', 'Habituation of PSA Bias', 
-                            'Habituation of PSA Angular Speed', 'Habituation of PSA Aspect Ratio',
-                            'Habituation of PSA Kink', 'Habituation of PSA Curve', 'Habituation of PSA Crab',
-                            'Spontaneous Recovery of Response Duration',
-                            'Spontaneous Recovery of Response Probability',
-                            'Spontaneous Recovery of Response Speed',    'Spontaneous Recovery of PSA Speed', 'Spontaneous Recovery of PSA Bias',
-                            'Spontaneous Recovery of PSA Angular Speed', 'Spontaneous Recovery of PSA Aspect Ratio',
-                            'Spontaneous Recovery of PSA Kink', 'Spontaneous Recovery of PSA Curve', 'Spontaneous Recovery of PSA Crab',
-                            'Memory Retention of Response Duration',
-                            'Memory Retention of Response Probability',
-                            'Memory Retention of Response Speed', 'Memory Retention of PSA Speed', 'Memory Retention of PSA Bias',
-                            'Memory Retention of PSA Angular Speed', 'Memory Retention of PSA Aspect Ratio',
-                            'Memory Retention of PSA Kink', 'Memory Retention of PSA Curve', 'Memory Retention of PSA Crab',
-                            'Sensitization of PSA Speed', 'Sensitization of PSA Bias',
-                            'Sensitization of PSA Angular Speed', 'Sensitization of PSA Aspect Ratio',
-                            'Sensitization of PSA Kink', 'Sensitization of PSA Curve', 'Sensitization of PSA Crab']
-
-        listofallelecolumns = ['dataset', 'Screen', 'Morphwidth', 'Midline', 'Area', 'Speed',
-                            'Angular Speed', 'Bias', 'Aspect Ratio', 'Kink', 'Curve', 'Crab',
-                            'Pathlength', 'Initial Response Duration',
-                            'Initial Response Probability', 'Initial Response Speed',
-                            'Initial PSA Speed', 'Initial PSA Bias', 'Initial PSA Angular Speed',
-                            'Initial PSA Aspect Ratio', 'Initial PSA Kink', 'Initial PSA Curve',
-                            'Initial PSA Crab', 
-                            'Final Response Duration', 'Final Response Probability',
-                            'Final Response Speed', 'Final PSA Speed', 'Final PSA Bias',
-                            'Final PSA Angular Speed', 'Final PSA Aspect Ratio', 'Final PSA Kink',
-                            'Final PSA Curve', 'Final PSA Crab',
-                            'Peak PSA Speed', 'Peak PSA Bias', 'Peak PSA Angular Speed',
-                            'Peak PSA Aspect Ratio', 'Peak PSA Kink', 'Peak PSA Curve', 'Peak PSA Crab',
-                            'Peak Tap Number of PSA Speed', 'Peak Tap Number of PSA Bias', 
-                            'Peak Tap Number of PSA Angular Speed', 'Peak Tap Number of PSA Aspect Ratio',
-                            'Peak Tap Number of PSA Kink', 'Peak Tap Number of PSA Curve', 'Peak Tap Number of PSA Crab',
-                            'Average PSA Speed', 'Average PSA Bias', 'Average PSA Angular Speed',
-                            'Average PSA Aspect Ratio', 'Average PSA Kink', 'Average PSA Curve', 
-                            'Average PSA Crab', 
-                            'Habituation of Response Duration',
-                            'Habituation of Response Probability', 'Habituation of Response Speed',
-                            'Habituation of PSA Speed', 'Habituation of PSA Bias',
-                            'Habituation of PSA Angular Speed', 'Habituation of PSA Aspect Ratio',
-                            'Habituation of PSA Kink', 'Habituation of PSA Curve', 'Habituation of PSA Crab',
-                            'Spontaneous Recovery of Response Duration',
-                            'Spontaneous Recovery of Response Probability',
-                            'Spontaneous Recovery of Response Speed',    'Spontaneous Recovery of PSA Speed', 'Spontaneous Recovery of PSA Bias',
-                            'Spontaneous Recovery of PSA Angular Speed', 'Spontaneous Recovery of PSA Aspect Ratio',
-                            'Spontaneous Recovery of PSA Kink', 'Spontaneous Recovery of PSA Curve', 'Spontaneous Recovery of PSA Crab',
-                            'Memory Retention of Response Duration',
-                            'Memory Retention of Response Probability',
-                            'Memory Retention of Response Speed', 'Memory Retention of PSA Speed', 'Memory Retention of PSA Bias',
-                            'Memory Retention of PSA Angular Speed', 'Memory Retention of PSA Aspect Ratio',
-                            'Memory Retention of PSA Kink', 'Memory Retention of PSA Curve', 'Memory Retention of PSA Crab',
-                            'Sensitization of PSA Speed', 'Sensitization of PSA Bias',
-                            'Sensitization of PSA Angular Speed', 'Sensitization of PSA Aspect Ratio',
-                            'Sensitization of PSA Kink', 'Sensitization of PSA Curve', 'Sensitization of PSA Crab']
-
-        # (1) Tap Response
-        tap_output =  read('tap_response_data', connection)
-        tap_output["Strain"] = tap_output["Gene"] + " (" + tap_output["Allele"] + ")"
-        
+    data = fetch_tables(DATA_KEYS, screens)
+    if screens is None:
+        logger.info("Loaded dashboard tables:\n%s", memory_report(data).to_string(index=False))
 
-        # (2) Tstat: Baseline + Tap + PSA tstat data by Allele 
-        tap_tstat_allele = aggregate_unique_values(read('tstat_allele_data', connection), ["dataset"]).explode('Screen').reset_index(drop=True)
-        numeric_cols = tap_tstat_allele.select_dtypes(include=np.number).columns
-        tap_tstat_allele[numeric_cols] = (tap_tstat_allele[numeric_cols] - tap_tstat_allele[numeric_cols].mean()) / tap_tstat_allele[numeric_cols].std()
-        tap_tstat_allele = subtract_by_control(tap_tstat_allele, id_col="dataset", control_id="N2", screen_col="Screen", numeric_cols=numeric_cols)
-        tap_tstat_allele = tap_tstat_allele.reset_index()
-        tap_tstat_allele = tap_tstat_allele.drop(columns=["index","level_0"], errors="ignore")  
+    return data
 
-        
 
+def screen_filter(screens, id_col=None, table=None):
+    """
+    Builds the read() condition restricting a table to the selected screens.
 
-        # (3) Tstat: Baseline + Tap + PSA tstat data by Gene
-        tap_tstat_data = aggregate_unique_values(read('tstat_gene_data', connection), ["Gene"]).explode('Screen').reset_index(drop=True)
-        numeric_cols = tap_tstat_data.select_dtypes(include=np.number).columns
-        tap_tstat_data[numeric_cols] = (tap_tstat_data[numeric_cols] - tap_tstat_data[numeric_cols].mean()) / tap_tstat_data[numeric_cols].std()
-        tap_tstat_data = subtract_by_control(tap_tstat_data, id_col="Gene", control_id="N2", screen_col="Screen", numeric_cols=numeric_cols)
-        tap_tstat_data = tap_tstat_data.reset_index()
-        tap_tstat_data = tap_tstat_data.drop(columns=["index", "level_0"], errors="ignore")  # clean up leftovers
+    Without `id_col` the rows of the selected screens are kept. With `id_col`,
+    every row of an id that appears in one of the selected screens is kept, for
+    tables that are aggregated across screens per id before being split back
+    out by screen.
 
+    Inputs:
+        screens (tuple of str): Selected screens, or None for no filter
+        id_col (str): Optional id column (e.g. "Gene" or "dataset")
+        table (str): Table to look up the ids in, required with `id_col`
 
-        # (4) MSD: Baseline + Tap + PSA by Gene
-        gene_MSD = aggregate_unique_values_MSD(read('gene_MSD', connection),["Gene"]).explode('Screen').reset_index(drop=True)
-        
+    Returns:
+        tuple: (where, params) to pass to read(); `where` is a psycopg.sql.Composable
+    """
+    if screens is None:
+        return None, None
+    if id_col is None:
+        return sql.SQL('"Screen" = ANY(%s)'), (list(screens),)
+    return (
+        sql.SQL('{id} IN (SELECT {id} FROM {table} WHERE "Screen" = ANY(%s))').format(
+            id=sql.Identifier(id_col), table=sql.Identifier(table)),
+        (list(screens),),
+    )
 
-        # (5) MSD: Baseline + Tap + PSA by Allele
-        allele_MSD = aggregate_unique_values_MSD(read('allele_MSD', connection),["dataset"]).explode('Screen').reset_index(drop=True)
-        
-        
-        # (6) Allele Profile (tstat melted) 
-        gene_profile_data=tap_tstat_data.reset_index()
-        gene_profile_data=gene_profile_data[listofgenecolumns]
-        gene_profile_data=pd.melt(gene_profile_data, id_vars=["Gene", "Screen"],
-                                    var_name='Metric',
-                                    value_name='T_score')
-        
-        
-        # (7) Gene Profile (tstat melted) 
-        allele_profile_data=tap_tstat_allele.reset_index()
-        allele_profile_data=allele_profile_data[listofallelecolumns]
-        allele_profile_data=pd.melt(allele_profile_data, id_vars=["dataset", "Screen"],
-                                    var_name='Metric',
-                                    value_name='T_score')
-        
-        
-        # (8) PSA summarised data
-        psa_output =  read('psa_summarised_data', connection)
-        
-        # (9) ID data
+
+def filter_screens(data, screens):
+    """
+    Keeps the rows of the selected screens in every table that has a Screen column.
+
+    Inputs:
+        data (dict of pd.DataFrame): Tables as returned by fetch_data()
+        screens (tuple of str): Selected screens
+
+    Returns:
+        dict: Filtered copy of the tables
+    """
+    return {
+        name: df[df["Screen"].isin(screens)].reset_index(drop=True) if "Screen" in df.columns else df
+        for name, df in data.items()
+    }
+
+
+# ------- Column lists for the melted profile tables -----------
+listofgenecolumns = ['Gene', 'Screen', 'Morphwidth', 'Midline', 'Area', 'Speed',
+                    'Angular Speed', 'Bias', 'Aspect Ratio', 'Kink', 'Curve', 'Crab',
+                    'Pathlength', 'Initial Response Duration',
+                    'Initial Response Probability', 'Initial Response Speed',
+                    'Initial PSA Speed', 'Initial PSA Bias', 'Initial PSA Angular Speed',
+                    'Initial PSA Aspect Ratio', 'Initial PSA Kink', 'Initial PSA Curve',
+                    'Initial PSA Crab', 
+                    'Final Response Duration', 'Final Response Probability',
+                    'Final Response Speed', 'Final PSA Speed', 'Final PSA Bias',
+                    'Final PSA Angular Speed', 'Final PSA Aspect Ratio', 'Final PSA Kink',
+                    'Final PSA Curve', 'Final PSA Crab',
+                    'Peak PSA Speed', 'Peak PSA Bias', 'Peak PSA Angular Speed',
+                    'Peak PSA Aspect Ratio', 'Peak PSA Kink', 'Peak PSA Curve', 'Peak PSA Crab',
+                    'Peak Tap Number of PSA Speed', 'Peak Tap Number of PSA Bias', 
+                    'Peak Tap Number of PSA Angular Speed', 'Peak Tap Number of PSA Aspect Ratio',
+                    'Peak Tap Number of PSA Kink', 'Peak Tap Number of PSA Curve', 'Peak Tap Number of PSA Crab',
+                    'Average PSA Speed', 'Average PSA Bias', 'Average PSA Angular Speed',
+                    'Average PSA Aspect Ratio', 'Average PSA Kink', 'Average PSA Curve', 
+                    'Average PSA Crab', 
+                    'Habituation of Response Duration',
+                    'Habituation of Response Probability', 'Habituation of Response Speed',
+                    'Habituation of PSA Speed', 'Habituation of PSA Bias', 
+                    'Habituation of PSA Angular Speed', 'Habituation of PSA Aspect Ratio',
+                    'Habituation of PSA Kink', 'Habituation of PSA Curve', 'Habituation of PSA Crab',
+                    'Spontaneous Recovery of Response Duration',
+                    'Spontaneous Recovery of Response Probability',
+                    'Spontaneous Recovery of Response Speed',    'Spontaneous Recovery of PSA Speed', 'Spontaneous Recovery of PSA Bias',
+                    'Spontaneous Recovery of PSA Angular Speed', 'Spontaneous Recovery of PSA Aspect Ratio',
+                    'Spontaneous Recovery of PSA Kink', 'Spontaneous Recovery of PSA Curve', 'Spontaneous Recovery of PSA Crab',
+                    'Memory Retention of Response Duration',
+                    'Memory Retention of Response Probability',
+                    'Memory Retention of Response Speed', 'Memory Retention of PSA Speed', 'Memory Retention of PSA Bias',
+                    'Memory Retention of PSA Angular Speed', 'Memory Retention of PSA Aspect Ratio',
+                    'Memory Retention of PSA Kink', 'Memory Retention of PSA Curve', 'Memory Retention of PSA Crab',
+                    'Sensitization of PSA Speed', 'Sensitization of PSA Bias',
+                    'Sensitization of PSA Angular Speed', 'Sensitization of PSA Aspect Ratio',
+                    'Sensitization of PSA Kink', 'Sensitization of PSA Curve', 'Sensitization of PSA Crab']
+
+listofallelecolumns = ['dataset', 'Screen', 'Morphwidth', 'Midline', 'Area', 'Speed',
+                    'Angular Speed', 'Bias', 'Aspect Ratio', 'Kink', 'Curve', 'Crab',
+                    'Pathlength', 'Initial Response Duration',
+                    'Initial Response Probability', 'Initial Response Speed',
+                    'Initial PSA Speed', 'Initial PSA Bias', 'Initial PSA Angular Speed',
+                    'Initial PSA Aspect Ratio', 'Initial PSA Kink', 'Initial PSA Curve',
+                    'Initial PSA Crab', 
+                    'Final Response Duration', 'Final Response Probability',
+                    'Final Response Speed', 'Final PSA Speed', 'Final PSA Bias',
+                    'Final PSA Angular Speed', 'Final PSA Aspect Ratio', 'Final PSA Kink',
+                    'Final PSA Curve', 'Final PSA Crab',
+                    'Peak PSA Speed', 'Peak PSA Bias', 'Peak PSA Angular Speed',
+                    'Peak PSA Aspect Ratio', 'Peak PSA Kink', 'Peak PSA Curve', 'Peak PSA Crab',
+                    'Peak Tap Number of PSA Speed', 'Peak Tap Number of PSA Bias', 
+                    'Peak Tap Number of PSA Angular Speed', 'Peak Tap Number of PSA Aspect Ratio',
+                    'Peak Tap Number of PSA Kink', 'Peak Tap Number of PSA Curve', 'Peak Tap Number of PSA Crab',
+                    'Average PSA Speed', 'Average PSA Bias', 'Average PSA Angular Speed',
+                    'Average PSA Aspect Ratio', 'Average PSA Kink', 'Average PSA Curve', 
+                    'Average PSA Crab', 
+                    'Habituation of Response Duration',
+                    'Habituation of Response Probability', 'Habituation of Response Speed',
+                    'Habituation of PSA Speed', 'Habituation of PSA Bias',
+                    'Habituation of PSA Angular Speed', 'Habituation of PSA Aspect Ratio',
+                    'Habituation of PSA Kink', 'Habituation of PSA Curve', 'Habituation of PSA Crab',
+                    'Spontaneous Recovery of Response Duration',
+                    'Spontaneous Recovery of Response Probability',
+                    'Spontaneous Recovery of Response Speed',    'Spontaneous Recovery of PSA Speed', 'Spontaneous Recovery of PSA Bias',
+                    'Spontaneous Recovery of PSA Angular Speed', 'Spontaneous Recovery of PSA Aspect Ratio',
+                    'Spontaneous Recovery of PSA Kink', 'Spontaneous Recovery of PSA Curve', 'Spontaneous Recovery of PSA Crab',
+                    'Memory Retention of Response Duration',
+                    'Memory Retention of Response Probability',
+                    'Memory Retention of Response Speed', 'Memory Retention of PSA Speed', 'Memory Retention of PSA Bias',
+                    'Memory Retention of PSA Angular Speed', 'Memory Retention of PSA Aspect Ratio',
+                    'Memory Retention of PSA Kink', 'Memory Retention of PSA Curve', 'Memory Retention of PSA Crab',
+                    'Sensitization of PSA Speed', 'Sensitization of PSA Bias',
+                    'Sensitization of PSA Angular Speed', 'Sensitization of PSA Aspect Ratio',
+                    'Sensitization of PSA Kink', 'Sensitization of PSA Curve', 'Sensitization of PSA Crab']
+
+
+def load_tap_output(pool, screens=None):
+    # (1) Tap Response
+    where, params = screen_filter(screens)
+    with pool.connection() as connection:
+        tap_output = read('tap_response_data', connection, where=where, params=params)
+    tap_output["Strain"] = tap_output["Gene"] + " (" + tap_output["Allele"] + ")"
+    return {"tap_output": tap_output, "tap_summary": summarise_taps(tap_output)}
+
+
+def normalize_tstat(tstat_data, id_col, profile_columns):
+    """
+    Aggregates a tstat table by id, z-scores every metric, subtracts the control
+    of each screen and melts the result into the profile table.
+
+    Inputs:
+        tstat_data (pd.DataFrame): tstat_gene_data or tstat_allele_data, all screens
+        id_col (str): Id column ("Gene" or "dataset")
+        profile_columns (list of str): Columns kept in the melted profile table
+
+    Cells holding (tstat, p-value) pairs are split first (split_tstat_pairs()):
+    the tstat values are normalized, and the p-values, averaged per id like
+    the tstat values, are returned as a table parallel to the tstat table.
+
+    Returns:
+        tuple of pd.DataFrame: (normalized tstat table, melted profile table,
+                                p-values in the rows and columns of the tstat table)
+    """
+    tstat_data, pvalue_data = split_tstat_pairs(tstat_data, [id_col, "Screen"])
+    tap_tstat = aggregate_unique_values(tstat_data, [id_col]).explode('Screen').reset_index(drop=True)
+    numeric_cols = tap_tstat.select_dtypes(include=np.number).columns
+    tap_tstat[numeric_cols] = (tap_tstat[numeric_cols] - tap_tstat[numeric_cols].mean()) / tap_tstat[numeric_cols].std()
+    tap_tstat = subtract_by_control(tap_tstat, id_col=id_col, control_id=CONTROL_IDS, screen_col="Screen", numeric_cols=numeric_cols)
+    tap_tstat = tap_tstat.reset_index()
+    tap_tstat = tap_tstat.drop(columns=["index", "level_0"], errors="ignore")  # clean up leftovers
+
+    profile_data = tap_tstat.reset_index()
+    profile_data = profile_data[profile_columns]
+    profile_data = pd.melt(profile_data, id_vars=[id_col, "Screen"],
+                           var_name='Metric',
+                           value_name='T_score')
+
+    pvalues = aggregate_unique_values(pvalue_data, [id_col]).drop(columns=["Screen"])
+    pvalues = tap_tstat[[id_col, "Screen"]].merge(pvalues, on=id_col, how="left")[tap_tstat.columns]
+
+    return tap_tstat, profile_data, pvalues
+
+
+# Source tstat table -> (id column, profile columns, dashboard table -> materialized table)
+TSTAT_SOURCES = {
+    "tstat_allele_data": ("dataset", listofallelecolumns, {
+        "tap_tstat_allele": "tstat_allele_normalised",
+        "allele_profile_data": "allele_profile_normalised",
+        "tap_tstat_allele_pvalues": "tstat_allele_pvalues",
+    }),
+    "tstat_gene_data": ("Gene", listofgenecolumns, {
+        "tap_tstat_data": "tstat_gene_normalised",
+        "gene_profile_data": "gene_profile_normalised",
+        "tap_tstat_pvalues": "tstat_gene_pvalues",
+    }),
+}
+
+
+def load_tstat(pool, source, screens=None):
+    id_col, profile_columns, materialized = TSTAT_SOURCES[source]
+    with pool.connection() as connection:
+        if is_current(connection, source, materialized.values()):
+            # Finished tables from materialize_tstat(), so the screens can be filtered in SQL.
+            # The p-values are matched to the tstat values by row position, so
+            # every table is read in the same (id, screen) order
+            where, params = screen_filter(screens)
+            return {
+                name: read(table, connection, where=where, params=params, order_by=[id_col, "Screen"])
+                for name, table in materialized.items()
+            }
+        # Otherwise read in full: the z-scores use the mean and std over all screens
+        tstat_data = read(source, connection)
+
+    tables = dict(zip(materialized, normalize_tstat(tstat_data, id_col, profile_columns)))
+    return tables if screens is None else filter_screens(tables, screens)
+
+
+def load_tstat_allele(pool, screens=None):
+    # (2) Tstat: Baseline + Tap + PSA tstat data by Allele, (7) Allele Profile (tstat melted)
+    return load_tstat(pool, "tstat_allele_data", screens)
+
+
+def load_tstat_gene(pool, screens=None):
+    # (3) Tstat: Baseline + Tap + PSA tstat data by Gene, (6) Gene Profile (tstat melted)
+    return load_tstat(pool, "tstat_gene_data", screens)
+
+
+def materialize_tstat(connection):
+    """
+    Writes the normalized tstat and melted profile tables back to PostgreSQL,
+    so the dashboard reads finished tables instead of normalizing on every
+    cold start. Run after new screens are uploaded (see materialize_tables.py).
+    Until then, or if a source table changes afterwards, the dashboard falls
+    back to normalizing in memory.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+
+    Returns:
+        list of str: Names of the tables written
+    """
+    written = []
+    for source, (id_col, profile_columns, materialized) in TSTAT_SOURCES.items():
+        version = database_version(connection, [source])
+        tables = normalize_tstat(read(source, connection), id_col, profile_columns)
+        for table, df in zip(materialized.values(), tables):
+            write_table(connection, table, df, source, version)
+            written.append(table)
+
+    return written
+
+
+# Column types that already hold plain tstat values
+_NUMERIC_TYPE_NAMES = {"smallint", "integer", "bigint", "real", "double precision", "numeric"}
+
+# Tstat value and FDR p-value of a "(tstat, p)" pair cell stored as text
+_PAIR_PART = r"^\s*[(\[{]?\s*([^,\s)\]}]+)\s*(?:,\s*([^,\s)\]}]+))?"
+
+
+def _pair_part(column, part):
+    # SQL for one part of a pair cell, as a float; None/NULL become NULL
+    value = sql.SQL("(regexp_match({}::text, {}))[{}]").format(sql.Identifier(column), sql.Literal(_PAIR_PART), sql.Literal(part))
+    return sql.SQL("CASE WHEN lower({value}) IN ('none', 'null', '') THEN NULL ELSE {value}::double precision END").format(value=value)
+
+
+def upgrade_tstat_schema(connection):
+    """
+    Converts the tstat source tables written before Step4 split the pairs:
+    every metric column holding `(tstat, p_value)` pairs becomes a float
+    column of tstat values, next to a `<metric> q` float column of FDR
+    p-values. Columns that are already numeric get an empty `q` column, and
+    converted tables are left alone, so the upgrade can be rerun.
+
+    Each table is converted in place, in one transaction, keeping its keys
+    and row count, so the snapshots and materialized tables built from it
+    stay current (split_tstat_pairs() reads both schemas the same way).
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+
+    Returns:
+        list of str: Names of the tables that were changed
+    """
+    upgraded = []
+    for source, (id_col, _, _) in TSTAT_SOURCES.items():
+        with connection.transaction(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+                (source,),
+            )
+            columns = dict(cursor.fetchall())
+            metrics = [
+                col for col in columns
+                if col not in (id_col, "Screen") and not col.endswith(PVALUE_SUFFIX)
+            ]
+            statements = []
+            for col in metrics:
+                q_col = f"{col}{PVALUE_SUFFIX}"
+                if q_col not in columns:
+                    statements.append(sql.SQL("ALTER TABLE {} ADD COLUMN {} double precision").format(
+                        sql.Identifier(source), sql.Identifier(q_col)))
+                if columns[col] not in _NUMERIC_TYPE_NAMES:
+                    statements.append(sql.SQL("UPDATE {} SET {} = {}").format(
+                        sql.Identifier(source), sql.Identifier(q_col), _pair_part(col, 2)))
+                    statements.append(sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE double precision USING {}").format(
+                        sql.Identifier(source), sql.Identifier(col), _pair_part(col, 1)))
+            for statement in statements:
+                cursor.execute(statement)
+        if statements:
+            upgraded.append(source)
+
+    return upgraded
+
+
+def load_MSD(pool, table, id_col, screens=None, ids=None):
+    """
+    Loads an MSD table, pooling the rows of each id across screens.
+
+    Since an id is pooled over all of its screens, every screen of the ids in
+    the selection is read, and the result is then cut back to the selection.
+
+    Inputs:
+        pool (psycopg_pool.ConnectionPool): Pool to borrow connections from
+        table (str): "gene_MSD" or "allele_MSD"
+        id_col (str): Id column ("Gene" or "dataset")
+        screens (tuple of str): Screens to load (default: all screens)
+        ids (list of str): Only load these ids (default: every id of `screens`)
+
+    Returns:
+        dict of pd.DataFrame: {table: pooled MSD table}
+    """
+    if ids is None:
+        where, params = screen_filter(screens, id_col=id_col, table=table)
+    else:
+        where, params = sql.SQL("{} = ANY(%s)").format(sql.Identifier(id_col)), (list(ids),)
+    with pool.connection() as connection:
+        MSD = read(table, connection, where=where, params=params)
+    MSD = aggregate_unique_values_MSD(MSD, [id_col]).explode('Screen').reset_index(drop=True)
+
+    tables = {table: MSD}
+    return tables if screens is None else filter_screens(tables, screens)
+
+
+def load_gene_MSD(pool, screens=None, ids=None):
+    # (4) MSD: Baseline + Tap + PSA by Gene
+    return load_MSD(pool, "gene_MSD", "Gene", screens, ids)
+
+
+def load_allele_MSD(pool, screens=None, ids=None):
+    # (5) MSD: Baseline + Tap + PSA by Allele
+    return load_MSD(pool, "allele_MSD", "dataset", screens, ids)
+
+
+def load_psa_output(pool, screens=None):
+    # (8) PSA summarised data
+    where, params = screen_filter(screens)
+    with pool.connection() as connection:
+        psa_output = read('psa_summarised_data', connection, where=where, params=params)
+    return {"psa_output": psa_output}
+
+
+def load_id_data(pool, screens=None):
+    # (9) ID data
+    with pool.connection() as connection:
         id_data = read('Gene_Allele_WormBaseID', connection) ##table in database with wormbase id's for all genes and alleles
+    return {"id_data": id_data}
 
-        # Melted/Profile data to be read after normalisation
-        # "gene_profile_data": aggregate_unique_values(read('gene_profile_data', connection),['Gene','Metric']).explode('Screen').reset_index(drop=True),
-        # "allele_profile_data": aggregate_unique_values(read('allele_profile_data', connection),['dataset','Metric']).explode('Screen').reset_index(drop=True),
-        
 
-        # ------------- Package the datasets --------------
+# Source table in PostgreSQL -> loader building the dashboard tables derived from it.
+# Largest tables first, so the long downloads start straight away
+SOURCE_LOADERS = {
+    "tap_response_data": load_tap_output,
+    "psa_summarised_data": load_psa_output,
+    "tstat_allele_data": load_tstat_allele,
+    "tstat_gene_data": load_tstat_gene,
+    "allele_MSD": load_allele_MSD,
+    "gene_MSD": load_gene_MSD,
+    "Gene_Allele_WormBaseID": load_id_data,
+}
+
+# Dashboard table -> source table it is built from, in the key order of fetch_data()
+TABLE_SOURCES = {
+    "tap_output": "tap_response_data",
+    "tap_summary": "tap_response_data",
+    "psa_output": "psa_summarised_data",
+    "tap_tstat_allele": "tstat_allele_data",
+    "tap_tstat_data": "tstat_gene_data",
+    "gene_profile_data": "tstat_gene_data",
+    "allele_profile_data": "tstat_allele_data",
+    "tap_tstat_pvalues": "tstat_gene_data",
+    "tap_tstat_allele_pvalues": "tstat_allele_data",
+    "gene_MSD": "gene_MSD",
+    "allele_MSD": "allele_MSD",
+    "id_data": "Gene_Allele_WormBaseID",
+}
 
-        data = {
-            "tap_output": tap_output,
-            "psa_output": psa_output,
-            "tap_tstat_allele": tap_tstat_allele,
-            "tap_tstat_data": tap_tstat_data,
-            "gene_profile_data": gene_profile_data,
-            "allele_profile_data": allele_profile_data,
-            "gene_MSD": gene_MSD,
-            "allele_MSD": allele_MSD,
-            "id_data": id_data
-        }
+DATA_KEYS = list(TABLE_SOURCES)
 
 
+def load_source(pool, source, screens=None):
+    """
+    Runs the loader of one source table and converts its tables to compact dtypes.
+
+    Inputs:
+        pool (psycopg_pool.ConnectionPool): Pool to borrow connections from
+        source (str): Source table name, a key of SOURCE_LOADERS
+        screens (tuple of str): Screens to load (default: all screens)
+
+    Returns:
+        dict of pd.DataFrame: The dashboard tables built from `source`
+    """
+    tables = SOURCE_LOADERS[source](pool, screens)
+    return {name: compact_dtypes(df, name) for name, df in tables.items()}
+
+
+def _thread_pool(max_workers):
+    # worker threads need the script context, otherwise st.cache_data warns
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        thread_name_prefix="fetch_data",
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    )
+
+
+def build_data(pool, screens=None):
+    """
+    Reads the dashboard tables from PostgreSQL and applies all post-processing
+    (aggregation, z-scoring, N2 subtraction and melting).
+
+    Every table is loaded by its own task in a thread pool. A task holds a pool
+    connection only while its table downloads, then hands it back before
+    post-processing, so aggregation and melting overlap with the remaining
+    downloads and the total load time approaches that of the slowest table.
+
+    Inputs:
+        pool (psycopg_pool.ConnectionPool): Pool to borrow connections from
+        screens (tuple of str): Screens to load (default: all screens)
+
+    Returns:
+        dict: Same tables as fetch_data()
+    """
+    with _thread_pool(len(SOURCE_LOADERS)) as executor:
+        futures = [executor.submit(load_source, pool, source, screens) for source in SOURCE_LOADERS]
+        tables = {}
+        for future in futures:
+            tables.update(future.result())
+
+    # ------------- Package the datasets --------------
+
+    data = {key: tables[key] for key in DATA_KEYS}
+
     return data
 
-@st.cache_data
-def fetch_baseline_data(list):
+
+# How the tables built from each source depend on its screens, which decides
+# what refresh_source() reloads when screens are uploaded:
+#   "screen": every row depends only on its own screen
+#   "all": rows depend on the whole table (z-scores over all screens, id table)
+#   any other value: id column; rows depend on every screen of their id
+SOURCE_REFRESH = {
+    "tap_response_data": "screen",
+    "psa_summarised_data": "screen",
+    "tstat_allele_data": "all",
+    "tstat_gene_data": "all",
+    "allele_MSD": "dataset",
+    "gene_MSD": "Gene",
+    "Gene_Allele_WormBaseID": "all",
+}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_marks():
     """
-    Connects to PostgreSQL database and loads all necessary tables for the dashboard.
-    
+    Returns the per-screen high-water marks of the source tables, checked at
+    most once a minute and shared by every session.
+
     Returns:
-        pd.DataFrame: Contains:
-                        - baseline_output
-    """
-    with psycopg.connect(
-        dbname="mwtdata", 
-        user=st.secrets["psql_user"], 
-        password=st.secrets["psql_passwword"], 
-        # host="rds-mwt-data.ctie02ksmcqc.ca-central-1.rds.amazonaws.com", 
-        host="142.103.210.25",
-        port=5432
-        ) as connection:
-        
-        
-        # (1) baseline output
+        dict: As computed by utils.snapshot.screen_marks()
+    """
+    with get_pool().connection() as connection:
+        return screen_marks(connection)
+
+
+def fetch_version():
+    """
+    Returns the current database version, shared by the loads of one page run.
+
+    Returns:
+        str: Version as computed by utils.snapshot.database_version()
+    """
+    return marks_version(fetch_marks())
+
+
+def changed_screens(old, new):
+    """
+    Lists the screens whose rows differ between two marks of one source table.
+
+    Inputs:
+        old (dict): Marks of the table when it was loaded
+        new (dict): Current marks of the table
+
+    Returns:
+        set of str: Added, removed or changed screens
+    """
+    return {
+        screen for screen in old["screens"].keys() | new["screens"].keys()
+        if old["screens"].get(screen) != new["screens"].get(screen)
+    }
+
+
+def merge_rows(tables, fresh, stale):
+    """
+    Replaces the stale rows of cached tables with freshly loaded rows.
+
+    Inputs:
+        tables (dict of pd.DataFrame): Cached tables
+        fresh (dict of pd.DataFrame): Reloaded rows, same keys as `tables`
+        stale (dict of pd.Series): Boolean mask of the rows to drop from each table
+
+    Returns:
+        dict of pd.DataFrame: The merged tables, with compact dtypes
+    """
+    merged = {}
+    for name, df in tables.items():
+        parts = [part for part in (df[~stale[name]], fresh[name]) if len(part)]
+        merged[name] = compact_dtypes(pd.concat(parts, ignore_index=True), name) if parts else fresh[name]
+
+    return merged
+
+
+def refresh_source(pool, source, screens, tables, old, new):
+    """
+    Brings cached tables of one source up to date with its current marks,
+    reloading as little as possible (see SOURCE_REFRESH):
+
+    - per-screen tables reload only the changed screens of the selection
+    - pooled MSD tables reload only the ids that appear in a changed screen,
+      since pooling changes those ids in every screen (all ids if rows were
+      deleted)
+    - tables depending on the whole source are reloaded for the selection
+
+    A table that was dropped and recreated (new OID) is always reloaded.
+
+    Inputs:
+        pool (psycopg_pool.ConnectionPool): Pool to borrow connections from
+        source (str): Source table name, a key of SOURCE_LOADERS
+        screens (tuple of str): Screens the tables were loaded for (None: all)
+        tables (dict of pd.DataFrame): Cached tables built from `source`
+        old (dict): Marks of `source` when `tables` were loaded
+        new (dict): Current marks of `source`
+
+    Returns:
+        dict of pd.DataFrame: The up-to-date tables
+    """
+    changed = changed_screens(old, new)
+    if not changed:
+        return tables
+    how = SOURCE_REFRESH[source]
+    # Rows deleted from a screen may have pooled into ids that can no longer be
+    # looked up, so pooled tables are reloaded in that case too
+    shrunk = any(new["screens"].get(screen, 0) < old["screens"].get(screen, 0) for screen in changed)
+    if how == "all" or old["oid"] != new["oid"] or (how != "screen" and shrunk):
+        return load_source(pool, source, screens)
+
+    if how == "screen":
+        if screens is not None:
+            changed &= set(screens)
+        if not changed:
+            return tables
+        fresh = load_source(pool, source, tuple(sorted(changed)))
+        stale = {name: df["Screen"].isin(changed) for name, df in tables.items()}
+        return merge_rows(tables, fresh, stale)
+
+    # Ids in a changed screen
+    with pool.connection() as connection:
         with connection.cursor() as cursor:
-            tuple = tuple(list)
-            cursor.execute(f'SELECT * FROM "baseline_output" WHERE "dataset" IN {tuple}')
+            cursor.execute(
+                sql.SQL('SELECT DISTINCT {id} FROM {table} WHERE "Screen" = ANY(%s)').format(
+                    id=sql.Identifier(how), table=sql.Identifier(source)),
+                (list(changed),),
+            )
+            ids = {row[0] for row in cursor.fetchall()}
+    if not ids:
+        return tables
+
+    fresh = {name: compact_dtypes(df, name) for name, df in SOURCE_LOADERS[source](pool, screens, ids=sorted(ids)).items()}
+    stale = {name: df[how].isin(ids) for name, df in tables.items()}
+    return merge_rows(tables, fresh, stale)
+
+
+# Memory cap of the tables cached across sessions, in MB; the least recently
+# used screen selections are dropped beyond it
+CACHE_MB = float(os.environ.get("MWT_CACHE_MB", 2048))
+
+
+def _table_bytes(tables):
+    return int(sum(df.memory_usage(index=True, deep=True).sum() for df in tables.values()))
+
+
+@st.cache_resource
+def _loaded_sources():
+    # (source, screens) -> {"marks": ..., "tables": ..., "views": ..., "bytes": ...},
+    # shared by every session, least recently used first
+    return {"lock": threading.Lock(), "locks": {}, "entries": OrderedDict()}
+
+
+def _evict(cache, keep):
+    # Drops the least recently used entries, except `keep`, until the cache fits in CACHE_MB
+    with cache["lock"]:
+        entries = cache["entries"]
+        total = sum(entry["bytes"] for entry in entries.values())
+        for key in list(entries):
+            if total <= CACHE_MB * 2**20:
+                break
+            if key != keep:
+                total -= entries.pop(key)["bytes"]
+                logger.info("evicted %s from the table cache", key)
+
+
+def source_version(source, marks):
+    """
+    Version of one source table, keying its snapshot: uploads to other
+    source tables leave it unchanged.
+
+    Inputs:
+        source (str): Source table name, a key of SOURCE_LOADERS
+        marks (dict): As returned by fetch_marks()
+
+    Returns:
+        str: Version as computed by utils.snapshot.marks_version()
+    """
+    return marks_version(marks, tables=[source])
+
+
+def _snapshot_tables(source, marks):
+    # Full tables of a source from its snapshot, or None without a current one
+    names = [name for name, table in TABLE_SOURCES.items() if table == source]
+    tables = load_snapshot(source_version(source, marks), key=source, tables=names)
+    if tables is None:
+        return None
+    return {name: compact_dtypes(df, name) for name, df in tables.items()}
+
+
+def _source_entry(source, screens):
+    # Cache entry of a source and selection, loaded or refreshed as needed
+    marks = fetch_marks()
+    cache = _loaded_sources()
+    key = (source, screens)
+    with cache["lock"]:
+        lock = cache["locks"].setdefault(key, threading.Lock())
+        full_cached = (source, None) in cache["entries"]
+
+    # One load per source and selection at a time; other keys load concurrently
+    with lock:
+        with cache["lock"]:
+            entry = cache["entries"].get(key)
+            if entry is not None:
+                cache["entries"].move_to_end(key)
+        if entry is None and screens is not None and full_cached:
+            # The full tables are in memory (e.g. from the warm-up): bring them
+            # up to date, which writes the new snapshot, and cut the selection out
+            tables = filter_screens(_source_entry(source, None)["tables"], screens)
+        elif entry is None:
+            tables = _snapshot_tables(source, marks)
+            if tables is None:
+                tables = load_source(get_pool(), source, screens)
+                if screens is None:
+                    save_snapshot(tables, source_version(source, marks), key=source)
+            elif screens is not None:
+                tables = filter_screens(tables, screens)
+        elif entry["marks"] != marks[source]:
+            tables = refresh_source(get_pool(), source, screens, entry["tables"], entry["marks"], marks[source])
+            if screens is None:
+                save_snapshot(tables, source_version(source, marks), key=source)
+        else:
+            return entry
+        # New tables start without views; stale ones go with the old entry
+        entry = {"marks": marks[source], "tables": tables, "views": {}, "bytes": _table_bytes(tables)}
+        with cache["lock"]:
+            cache["entries"][key] = entry
+            cache["entries"].move_to_end(key)
+        _evict(cache, keep=key)
+
+    return entry
+
+
+def _source_entries(tables, screens):
+    # Cache entries of the sources behind `tables`, loading missing ones concurrently
+    sources = list(dict.fromkeys(TABLE_SOURCES[name] for name in tables))
+    if not sources:
+        return {}
+
+    with st.spinner("Loading data..."):
+        with _thread_pool(len(sources)) as executor:
+            return dict(zip(sources, executor.map(lambda source: _source_entry(source, screens), sources)))
+
+
+def fetch_source(source, screens=None):
+    """
+    Loads the dashboard tables built from one source table, cached per source
+    and screen selection.
+
+    The first load of a selection is cut out of the full tables when those are
+    cached (refreshing them first if screens were uploaded), else comes from
+    the snapshot of the source's current version (see source_version()) if
+    there is one, and from the database otherwise. Later calls compare the
+    source's marks with those the tables were loaded at, and when screens were
+    uploaded in between only the affected rows are reloaded and merged in (see
+    refresh_source()), so new screens show up without clearing the cache.
+
+    Every full load or refresh (`screens` None) writes the source's snapshot,
+    so new processes start from the current data even after uploads.
+
+    The cache is shared by all sessions and keyed by the sorted screen tuple,
+    so a selection another user already made is served from memory. It is
+    capped at CACHE_MB (MWT_CACHE_MB environment variable); beyond that the
+    least recently used selections are dropped and reload on their next use.
+
+    Inputs:
+        source (str): Source table name, a key of SOURCE_LOADERS
+        screens (tuple of str): Screens to load (default: all screens)
+
+    Returns:
+        dict of pd.DataFrame: The dashboard tables built from `source`
+    """
+    tables = _source_entry(source, screens)["tables"]
+
+    # Copies, as st.cache_data would return, so pages can't change the cache
+    return {name: df.copy() for name, df in tables.items()}
+
+
+@profiled("fetch_tables")
+def fetch_tables(tables, screens=None):
+    """
+    Loads only the listed dashboard tables.
+
+    Each source table is loaded and cached on first access, so a page pays only
+    for the tables it declares. Sources not cached yet are loaded concurrently.
+
+    Inputs:
+        tables (list of str): Dashboard table names, keys of TABLE_SOURCES
+        screens (tuple of str): Screens to load (default: all screens)
+
+    Returns:
+        dict of pd.DataFrame: The requested tables
+    """
+    entries = _source_entries(tables, screens)
+
+    return {name: entries[TABLE_SOURCES[name]]["tables"][name].copy() for name in tables}
+
+
+@profiled("fetch_views")
+def fetch_views(tables, datasets):
+    """
+    Loads the listed dashboard tables as the pages see them: the same result
+    as select_datasets(fetch_tables(tables, screens), datasets), without the
+    per-rerun work.
+
+    Each view (see preprocess.dataset_view()) is built once per table and
+    screen selection and kept with the cached tables, so reruns and other
+    sessions with the same selection reuse it, and it is rebuilt when the
+    tables are refreshed. Views are returned as shallow copies, which share
+    the cached data: the dashboard runs with pandas copy-on-write, so a page
+    that changes a view changes its own copy only.
+
+    Inputs:
+        tables (list of str): Dashboard table names, keys of TABLE_SOURCES
+        datasets (list of str): Selected screens, in selection order
+
+    Returns:
+        dict: The requested tables, plus "datasets", "version" (identifies the
+              contents of the tables' sources, see marks_version()) and, when
+              an MSD table is requested, "phenotype_list" (as set by
+              select_datasets())
+    """
+    screens = tuple(sorted(datasets))
+    entries = _source_entries(tables, screens)
+
+    cache = _loaded_sources()
+    data = {}
+    for name in tables:
+        entry = entries[TABLE_SOURCES[name]]
+        view = entry["views"].get(name)
+        if view is None:
+            # Built outside the lock; if two sessions both build a missing
+            # view, the first one stored is kept and counted
+            built = dataset_view(name, entry["tables"][name])
+            with cache["lock"]:
+                view = entry["views"].setdefault(name, built)
+                added = view is built and view is not entry["tables"][name]
+                if added:
+                    entry["bytes"] += _table_bytes({name: view})
+            if added:
+                _evict(cache, keep=(TABLE_SOURCES[name], screens))
+        data[name] = view.copy(deep=False)
+
+    data["datasets"] = datasets
+    data["version"] = marks_version({source: entry["marks"] for source, entry in entries.items()}, tables=list(entries))
+    msd = data.get("gene_MSD", data.get("allele_MSD"))
+    if msd is not None:
+        data["phenotype_list"] = phenotype_names(msd)
+
+    return data
+
+
+# Table behind the "Download raw baseline data" buttons
+BASELINE_TABLE = "tap_baseline_data"
+
+# Rows fetched from the server per round trip when streaming the baseline table
+BASELINE_CHUNK_ROWS = 5_000
+
+# Baseline summaries kept in memory across sessions, and the seconds each is kept
+BASELINE_CACHE_ENTRIES = int(os.environ.get("MWT_BASELINE_CACHE_ENTRIES", 64))
+BASELINE_CACHE_TTL = int(os.environ.get("MWT_BASELINE_CACHE_TTL", 3600))
+
+
+def baseline_filter(screens=None, column=None, values=None):
+    """
+    Builds the read() condition selecting rows of the baseline tables.
+
+    Selecting "N2" in `values` also matches the N2 aliases stored in the tables.
+
+    Inputs:
+        screens (tuple of str): Screens to keep, or None for all screens
+        column (str): Optional id column to filter on (e.g. "Gene" or "dataset")
+        values (list of str): Values of `column` to keep
+
+    Returns:
+        tuple: (where, params) to pass to read(); `where` is a psycopg.sql.Composable
+    """
+    conditions, params = [], []
+    if screens is not None:
+        conditions.append(sql.SQL('"Screen" = ANY(%s)'))
+        params.append(list(screens))
+    if column is not None:
+        values = list(values)
+        if "N2" in values:
+            values += N2_ALIASES
+        conditions.append(sql.SQL("{} = ANY(%s)").format(sql.Identifier(column)))
+        params.append(values)
+
+    if not conditions:
+        return None, None
+    return sql.SQL(" AND ").join(conditions), tuple(params)
+
+
+def iter_baseline_csv(screens=None, column=None, values=None, chunk_rows=BASELINE_CHUNK_ROWS):
+    """
+    Streams the baseline table as CSV, one chunk of rows at a time.
+
+    Rows are read through a server-side (named) cursor, so only `chunk_rows`
+    rows are held in memory at once. The N2 control aliases are mapped to "N2"
+    as on the rest of the dashboard.
+
+    Inputs:
+        screens (tuple of str): Screens to keep (default: all screens)
+        column (str): Optional id column to filter on (e.g. "Gene" or "dataset")
+        values (list of str): Values of `column` to keep
+        chunk_rows (int): Rows per chunk
+
+    Yields:
+        bytes: UTF-8 encoded CSV; the first chunk starts with the header
+    """
+    where, params = baseline_filter(screens, column, values)
+    query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(BASELINE_TABLE))
+    if where:
+        query = sql.SQL("{} WHERE {}").format(query, where)
+
+    with get_pool().connection() as connection:
+        with connection.cursor(name="baseline_csv") as cursor:
+            cursor.execute(query, params)
+            header = True
+            while rows := cursor.fetchmany(chunk_rows):
+                chunk = replace_controls(pd.DataFrame(rows, columns=[desc.name for desc in cursor.description]))
+                yield chunk.to_csv(index=False, header=header).encode('utf-8')
+                header = False
+
+            # No rows: still return the column names
+            if header:
+                yield (",".join(desc.name for desc in cursor.description) + "\n").encode('utf-8')
+
+
+def fetch_baseline_data(screens=None, column=None, values=None):
+    """
+    Builds the raw baseline CSV download.
+
+    The CSV is assembled from iter_baseline_csv() chunks, so the full table is
+    never held as a DataFrame (or as Python row tuples) at any point; only the
+    encoded CSV that st.download_button() needs is kept.
+
+    Inputs:
+        screens (tuple of str): Screens to keep (default: all screens)
+        column (str): Optional id column to filter on (e.g. "Gene" or "dataset")
+        values (list of str): Values of `column` to keep
+
+    Returns:
+        io.BytesIO: CSV file to pass to st.download_button()
+    """
+    buffer = io.BytesIO()
+    for chunk in iter_baseline_csv(screens, column, values):
+        buffer.write(chunk)
+    buffer.seek(0)
+
+    return buffer
+
+
+# Baseline summary pyramid, finest level first: table name -> bin width in
+# seconds, or None for one row per plate
+BASELINE_LEVELS = {
+    "baseline_1s": 1,
+    "baseline_10s": 10,
+    "baseline_plate": None,
+}
+
+# Columns identifying a plate in the baseline tables
+BASELINE_KEYS = ["Screen", "dataset", "Gene", "Allele", "Plate_id", "Date"]
+
+# Postgres type OIDs of the numeric columns summarised by the pyramid
+_NUMERIC_TYPES = {20, 21, 23, 700, 701, 1700}
+
+
+def baseline_metrics(connection):
+    """
+    Lists the measured columns of the raw baseline table (every numeric
+    column except Time).
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+
+    Returns:
+        list of str: Metric column names
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(BASELINE_TABLE)))
+        return [desc.name for desc in cursor.description if desc.type_code in _NUMERIC_TYPES and desc.name != "Time"]
+
+
+def baseline_summary_query(metrics, width=None, where=None):
+    """
+    Builds the query summarising the raw baseline table into time bins.
+
+    Every metric gets "-mean", "-sem" and "-count" columns, named as in the MSD
+    tables. Bins are labelled by their start time.
+
+    Inputs:
+        metrics (list of str): Metric columns, see baseline_metrics()
+        width (float): Bin width in seconds, or None for one row per plate
+        where (psycopg.sql.Composable): Optional condition on the raw rows, from
+                                        baseline_filter(); may contain %s placeholders
+
+    Returns:
+        psycopg.sql.Composed: The SELECT query
+    """
+    keys = [sql.Identifier(key) for key in BASELINE_KEYS]
+    columns = list(keys)
+    if width is not None:
+        columns.append(sql.SQL('floor("Time" / {width}) * {width} AS "Time"').format(width=sql.Literal(width)))
+    for metric in metrics:
+        m = sql.Identifier(metric)
+        columns += [
+            sql.SQL("avg({})::double precision AS {}").format(m, sql.Identifier(f"{metric}-mean")),
+            sql.SQL("(stddev_samp({m}) / sqrt(NULLIF(count({m}), 0)))::double precision AS {name}").format(
+                m=m, name=sql.Identifier(f"{metric}-sem")),
+            sql.SQL("count({})::bigint AS {}").format(m, sql.Identifier(f"{metric}-count")),
+        ]
+
+    query = sql.SQL("SELECT {} FROM {}").format(sql.SQL(", ").join(columns), sql.Identifier(BASELINE_TABLE))
+    if where:
+        query = sql.SQL("{} WHERE {}").format(query, where)
+    return sql.SQL("{} GROUP BY {}").format(
+        query,
+        sql.SQL(", ").join(sql.Literal(i + 1) for i in range(len(keys) + (width is not None))),
+    )
+
+
+def materialize_baseline(connection):
+    """
+    Writes the baseline summary pyramid (BASELINE_LEVELS) to PostgreSQL. The
+    bins are computed on the server, so the raw table never leaves the
+    database. Run after new screens are uploaded (see materialize_tables.py).
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+
+    Returns:
+        list of str: Names of the tables written
+    """
+    version = database_version(connection, [BASELINE_TABLE])
+    metrics = baseline_metrics(connection)
+    for table, width in BASELINE_LEVELS.items():
+        write_query(
+            connection, table, baseline_summary_query(metrics, width), BASELINE_TABLE, version,
+            indexes=[["Screen", "dataset"], ["Screen", "Gene"]],
+        )
+
+    return list(BASELINE_LEVELS)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_baseline_version():
+    """
+    Returns the version of the raw baseline table, checked at most once a
+    minute. The row counts come from the load log, so the table is not scanned.
+
+    Returns:
+        str: Version as computed by utils.snapshot.database_version()
+    """
+    with get_pool().connection() as connection:
+        return database_version(connection, [BASELINE_TABLE])
+
+
+@st.cache_data(show_spinner=False)
+def fetch_baseline_levels(version):
+    """
+    Returns the pyramid levels that were built from a version of the raw
+    baseline table, as recorded in the materialized table log.
+
+    Inputs:
+        version (str): Raw table version, from fetch_baseline_version()
+
+    Returns:
+        list of str: Current level table names, finest first
+    """
+    with get_pool().connection() as connection:
+        return [table for table in BASELINE_LEVELS if materialized_version(connection, table) == version]
+
+
+def baseline_level(resolution=None, levels=BASELINE_LEVELS):
+    """
+    Picks the coarsest pyramid level that can answer a request.
+
+    A level can answer a request if its bins nest inside the requested bins:
+    the per-plate level answers only per-plate requests, any binned level
+    answers per-plate requests, and a binned level answers requests whose
+    width is a multiple of its own.
+
+    Inputs:
+        resolution (float): Requested bin width in seconds, or None for one row per plate
+        levels (list of str): Levels to choose from (default: all levels)
+
+    Returns:
+        str: Level table name, or None if only the raw table can answer
+    """
+    usable = [
+        table for table in levels
+        if resolution is None or (BASELINE_LEVELS[table] is not None and resolution % BASELINE_LEVELS[table] == 0)
+    ]
+    return usable[-1] if usable else None
+
+
+def rebin_baseline(summary, resolution=None):
+    """
+    Merges summary bins into coarser bins.
+
+    The mean, sem and count of each merged bin are computed exactly from those
+    of its parts, through the per-bin sums and sums of squares.
+
+    Inputs:
+        summary (pd.DataFrame): Rows of a pyramid level
+        resolution (float): New bin width in seconds, or None for one row per plate
+
+    Returns:
+        pd.DataFrame: The summary at the new resolution
+    """
+    metrics = [col[:-len("-mean")] for col in summary.columns if col.endswith("-mean")]
+    keys = summary[BASELINE_KEYS]
+    if resolution is not None:
+        keys = keys.assign(Time=np.floor(summary["Time"] / resolution) * resolution)
+
+    n = summary[[f"{metric}-count" for metric in metrics]].to_numpy(dtype=float)
+    mean = summary[[f"{metric}-mean" for metric in metrics]].to_numpy(dtype=float)
+    # A single-row bin has no sem but contributes no variance either
+    var = np.nan_to_num(summary[[f"{metric}-sem" for metric in metrics]].to_numpy(dtype=float) ** 2 * n)
+    total = np.nan_to_num(mean * n)
+    squares = np.nan_to_num((n - 1) * var + n * mean**2)
+
+    sums = pd.concat(
+        [keys, pd.DataFrame(np.hstack([n, total, squares]), index=summary.index)], axis=1
+    ).groupby(list(keys.columns), sort=False, dropna=False).sum()
+    k = len(metrics)
+    n, total, squares = (sums.iloc[:, i * k:(i + 1) * k].to_numpy() for i in range(3))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / n
+        # Rounding can leave a tiny negative sum of squared deviations
+        sem = np.sqrt(np.maximum(squares - n * mean**2, 0) / (n - 1) / n)
+    sem[n < 2] = np.nan
+
+    result = {}
+    for i, metric in enumerate(metrics):
+        result[f"{metric}-mean"] = mean[:, i]
+        result[f"{metric}-sem"] = sem[:, i]
+        result[f"{metric}-count"] = n[:, i].astype(np.int64)
+
+    return pd.DataFrame(result, index=sums.index).reset_index()
+
+
+def fetch_baseline_summary(screens=None, column=None, values=None, resolution=None):
+    """
+    Returns baseline metrics (mean, sem and count per bin) for the selection.
+
+    The coarsest up-to-date pyramid level that can answer the request is read
+    and, if its bins are finer than requested, merged with rebin_baseline().
+    Without a usable level the raw table is summarised on the server, so only
+    the summary is ever transferred. Results are cached per version of the raw
+    table, so a logged upload is picked up within a minute.
+
+    Inputs:
+        screens (tuple of str): Screens to keep (default: all screens)
+        column (str): Optional id column to filter on (e.g. "Gene" or "dataset")
+        values (tuple of str): Values of `column` to keep
+        resolution (float): Bin width in seconds, or None for one row per plate
+
+    Returns:
+        pd.DataFrame: Summary with the BASELINE_KEYS (and Time) columns followed
+                      by "<metric>-mean", "<metric>-sem" and "<metric>-count"
+    """
+    return _baseline_summary(fetch_baseline_version(), screens, column, values, resolution)
 
-            # Fetch all rows from database
-            record = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
-            baseline_output = pd.DataFrame(record, columns=column_names)
 
-        # ------------- Package the datasets --------------
+# fetch_baseline_summary() for one version of the raw table; past
+# BASELINE_CACHE_ENTRIES the least recently used selections are dropped
+@st.cache_data(max_entries=BASELINE_CACHE_ENTRIES, ttl=BASELINE_CACHE_TTL, show_spinner=False)
+def _baseline_summary(version, screens, column, values, resolution):
+    where, params = baseline_filter(screens, column, values)
+    level = baseline_level(resolution, fetch_baseline_levels(version))
 
-        data = {
-            "baseline_output": baseline_output,
-        }
+    with get_pool().connection() as connection:
+        if level is None:
+            query = baseline_summary_query(baseline_metrics(connection), resolution, where)
+            with connection.cursor() as cursor:
+                cursor.execute(query, params)
+                summary = pd.DataFrame(cursor.fetchall(), columns=[desc.name for desc in cursor.description])
+        else:
+            summary = read(level, connection, where=where, params=params)
+            if BASELINE_LEVELS[level] != resolution:
+                summary = rebin_baseline(summary, resolution)
 
-    return data
\ No newline at end of file
+    keys = BASELINE_KEYS if resolution is None else BASELINE_KEYS + ["Time"]
+    return replace_controls(summary.sort_values(keys, ignore_index=True))
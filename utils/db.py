@@ -0,0 +1,59 @@
+# utils/db.py
+import streamlit as st
+from psycopg_pool import ConnectionPool
+
+# Upper bound on open connections for the whole server process. build_data()
+# uses up to one per source table; the rest serve concurrent download buttons.
+MAX_CONNECTIONS = 8
+
+# Close connections that have been idle this long (seconds), down to min_size
+MAX_IDLE = 5 * 60
+
+# Replace every connection after this long (seconds), so server restarts and
+# dropped routes don't leave the pool holding dead sockets
+MAX_LIFETIME = 60 * 60
+
+
+def connection_kwargs():
+    """
+    Returns the connection parameters for the MWT PostgreSQL database.
+
+    Returns:
+        dict: Keyword arguments for psycopg.connect()
+    """
+    return dict(
+        dbname="mwtdata",
+        user=st.secrets["psql_user"],
+        password=st.secrets["psql_passwword"],
+        # host="rds-mwt-data.ctie02ksmcqc.ca-central-1.rds.amazonaws.com",
+        host="142.103.210.25",
+        port=5432
+    )
+
+
+@st.cache_resource
+def get_pool():
+    """
+    Returns the connection pool shared by every session of this server process.
+
+    The pool is created on first use and kept by st.cache_resource for the life
+    of the process. Connections are checked before being handed out, so a
+    connection closed by the server is replaced instead of failing the query.
+
+    Usage:
+        with get_pool().connection() as connection:
+            df = read('tap_response_data', connection)
+
+    Returns:
+        psycopg_pool.ConnectionPool: Open connection pool
+    """
+    return ConnectionPool(
+        kwargs=connection_kwargs(),
+        min_size=1,
+        max_size=MAX_CONNECTIONS,
+        max_idle=MAX_IDLE,
+        max_lifetime=MAX_LIFETIME,
+        check=ConnectionPool.check_connection,
+        name="mwtdata",
+        open=True,
+    )
@@ -0,0 +1,76 @@
+# utils/dtypes.py
+import pandas as pd
+
+# Identifier columns, stored as categoricals wherever they appear
+ID_COLUMNS = ["Screen", "dataset", "Gene", "Allele", "Strain", "Plate_id", "Date", "Metric"]
+
+# Compact dtypes per dashboard table. "float" stands for every other float
+# column of the table. Tables not listed here are small and left as they are.
+DTYPE_SCHEMA = {
+    "tap_output": {"taps": "Int16", "float": "float32"},
+    "tap_summary": {"taps": "Int16", "float": "float32"},
+    "psa_output": {"float": "float32"},
+    "gene_profile_data": {"T_score": "float32"},
+    "allele_profile_data": {"T_score": "float32"},
+}
+
+
+def compact_dtypes(df, table):
+    """
+    Converts a dashboard table to the compact dtypes in DTYPE_SCHEMA.
+
+    Identifier columns become categoricals whose categories are in order of first
+    appearance, so seaborn and plotly keep drawing them in the same order as the
+    original strings. Floats are downcast to float32 (the measurements carry far
+    fewer than 7 significant digits) and tap numbers become nullable ints.
+    Already compact columns are left alone, so the conversion is idempotent.
+
+    Inputs:
+        df (pd.DataFrame): Table as built by the loader
+        table (str): Dashboard table name (e.g. "tap_output")
+
+    Returns:
+        pd.DataFrame: The table with compact dtypes
+    """
+    schema = DTYPE_SCHEMA.get(table)
+    if schema is None:
+        return df
+
+    dtypes = {}
+    for col in df.columns:
+        if col in ID_COLUMNS and df[col].dtype == object:
+            dtypes[col] = pd.CategoricalDtype(pd.unique(df[col].dropna()))
+        elif col in schema:
+            dtypes[col] = schema[col]
+        elif "float" in schema and df[col].dtype.kind == "f":
+            dtypes[col] = schema["float"]
+
+    return df.astype(dtypes)
+
+
+def memory_report(data):
+    """
+    Summarises the memory held by a dict of tables.
+
+    Inputs:
+        data (dict): Dashboard tables, as returned by fetch_data() or fetch_tables();
+                     entries that are not DataFrames are skipped
+
+    Returns:
+        pd.DataFrame: One row per table with rows, columns and MB, largest first,
+                      plus a "total" row
+    """
+    rows = [
+        {
+            "table": name,
+            "rows": len(df),
+            "columns": df.shape[1],
+            "MB": df.memory_usage(index=True, deep=True).sum() / 2**20,
+        }
+        for name, df in data.items()
+        if isinstance(df, pd.DataFrame)
+    ]
+    report = pd.DataFrame(rows, columns=["table", "rows", "columns", "MB"]).sort_values("MB", ascending=False)
+    total = pd.DataFrame([{"table": "total", "rows": report["rows"].sum(), "columns": report["columns"].sum(), "MB": report["MB"].sum()}])
+
+    return pd.concat([report, total], ignore_index=True)
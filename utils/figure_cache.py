@@ -0,0 +1,129 @@
+# utils/figure_cache.py
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+import pandas as pd
+import streamlit as st
+from utils.profiling import stage
+
+logger = logging.getLogger(__name__)
+
+# Memory cap of the figures cached across sessions, in MB; the least recently
+# used figures are dropped beyond it
+FIGURE_CACHE_MB = float(os.environ.get("MWT_FIGURE_CACHE_MB", 256))
+
+
+@st.cache_resource
+def _figure_cache():
+    # key -> {"value": ..., "bytes": ...}, shared by every session, least
+    # recently used first; hits and misses are counted per (page, figure)
+    return {"lock": threading.Lock(), "entries": OrderedDict(), "hits": Counter(), "misses": Counter()}
+
+
+def _figure_bytes(value):
+    # PNG bytes, or a Plotly figure as the JSON sent to the browser
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(value.to_json())
+
+
+def figure_key(data, page, figure, *inputs):
+    """
+    Identifies a figure by everything it is drawn from: the database version
+    and screen selection of the page's data and the figure's own inputs (e.g.
+    the selected phenotype and genes).
+
+    Inputs:
+        data (dict): The page's data, as returned by fetch_views()
+        page (str): Page module name, e.g. "home"
+        figure (str): Figure name, e.g. "rank" or "heatmap"
+        *inputs: Other values the figure depends on, with stable repr()s
+
+    Returns:
+        tuple: (page, figure, hex digest of the inputs)
+    """
+    state = (data.get("version"), tuple(sorted(data.get("datasets", ()))), inputs)
+    return (page, figure, hashlib.sha1(repr(state).encode("utf-8")).hexdigest())
+
+
+def cached_figure(key, build, *args):
+    """
+    Returns the figure build(*args) draws, from memory when the same figure
+    was drawn before, by any session.
+
+    Figures (Plotly figures or PNG bytes) are kept across sessions up to
+    FIGURE_CACHE_MB (MWT_FIGURE_CACHE_MB environment variable); beyond that
+    the least recently used are dropped. Cached Plotly figures are shared, so
+    the caller must not change them: build() should return the finished
+    figure, layout included.
+
+    Inputs:
+        key (tuple): From figure_key(), covering everything build() depends on
+        build (function): Draws the figure
+        *args: Arguments of build
+
+    Returns:
+        The figure
+    """
+    cache = _figure_cache()
+    page, figure, _ = key
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is not None:
+            cache["entries"].move_to_end(key)
+            cache["hits"][page, figure] += 1
+            return entry["value"]
+        cache["misses"][page, figure] += 1
+
+    # Two sessions may both draw a missing figure; either result is kept
+    with stage(f"build: {figure}"):
+        value = build(*args)
+    entry = {"value": value, "bytes": _figure_bytes(value)}
+
+    with cache["lock"]:
+        entries = cache["entries"]
+        entries[key] = entry
+        total = sum(entry["bytes"] for entry in entries.values())
+        for old in list(entries):
+            if total <= FIGURE_CACHE_MB * 2**20:
+                break
+            if old != key:
+                total -= entries.pop(old)["bytes"]
+                logger.info("evicted %s from the figure cache", old[:2])
+
+    return value
+
+
+def figure_cache_stats():
+    """
+    Summarises the figure cache per page and figure.
+
+    Returns:
+        pd.DataFrame: page, figure, hits, misses, cached (figures in memory) and MB
+    """
+    cache = _figure_cache()
+    with cache["lock"]:
+        names = set(cache["hits"]) | set(cache["misses"])
+        cached = Counter((page, figure) for page, figure, _ in cache["entries"])
+        size = Counter()
+        for (page, figure, _), entry in cache["entries"].items():
+            size[page, figure] += entry["bytes"]
+        rows = [
+            [page, figure, cache["hits"][page, figure], cache["misses"][page, figure],
+             cached[page, figure], round(size[page, figure] / 2**20, 3)]
+            for page, figure in sorted(names)
+        ]
+    return pd.DataFrame(rows, columns=["page", "figure", "hits", "misses", "cached", "MB"])
+
+
+def figure_cache_panel():
+    """
+    Shows figure_cache_stats() in the sidebar.
+    """
+    stats = figure_cache_stats()
+    with st.sidebar.expander("Figure cache (admin)"):
+        st.write(f"{stats['MB'].sum():.1f} of {FIGURE_CACHE_MB:.0f} MB, "
+                 f"{stats['hits'].sum()} hits, {stats['misses'].sum()} misses")
+        st.dataframe(stats, hide_index=True, use_container_width=True)
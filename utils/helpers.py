@@ -1,9 +1,14 @@
 # utils/helpers.py
 
+import io
+import re
 import pandas as pd
 import sqlite3
 import streamlit as st
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from psycopg import sql
 
 @st.cache_data
 def convert_df(df):
@@ -13,53 +18,222 @@ def convert_df(df):
     return df.to_csv(index=False).encode('utf-8')
 
 
-def transform_tap_tstat_heatmap(df, pvalue_threshold=0.05, id_column='Gene'):
+# Suffix of the FDR p-value column paired with each tstat column
+PVALUE_SUFFIX = " q"
+
+# Pair written as text, e.g. "(1.5, 0.01)", "[1.5, None]" or "{1.5,NULL}"
+_PAIR_TEXT = re.compile(r"^\s*[(\[{]?\s*([^,\s)\]}]+)\s*(?:,\s*([^,\s)\]}]+))?")
+
+
+def _text_number(text):
+    if text is None or text.lower() in ("none", "null", ""):
+        return np.nan
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _split_pair(cell):
+    # (tstat, p) pair -> its parts; plain values have no p-value
+    if isinstance(cell, (tuple, list, np.ndarray)):
+        if len(cell) >= 2:
+            return cell[0], cell[1]
+        if len(cell) == 1:
+            return cell[0], np.nan
+        return np.nan, np.nan
+    if isinstance(cell, str):
+        match = _PAIR_TEXT.match(cell)
+        if match is None:
+            return np.nan, np.nan
+        return _text_number(match.group(1)), _text_number(match.group(2))
+    return cell, np.nan
+
+
+def split_tstat_pairs(df, id_columns):
     """
-    Convert tuple-valued tap_tstat cells into plottable numeric values.
+    Splits a tstat table into two parallel numeric tables of tstat values and
+    FDR p-values, so p-values are parsed once at load time rather than on
+    every render.
+
+    Both schemas of the tstat tables are read:
+        - paired float columns, `<metric>` holding the tstat value and
+          `<metric> q` its p-value (written by Step4 since the pairs were split)
+        - older rows with `(tstat, p_value)` pairs in a single column, which come
+          back as tuples, arrays or text
+    Numeric columns without a `q` column are kept as they are, with no p-values.
 
-    Each non-Gene cell is expected to contain `(effect_size, p_value)`.
-    Values with p-values greater than or equal to the threshold are replaced
-    with zero for plotting.
+    Inputs:
+        df (pd.DataFrame): tstat table, e.g. tstat_gene_data
+        id_columns (list of str): Non-value columns, copied to both tables
+
+    Returns:
+        tuple of pd.DataFrame: (tstat values, p-values), with the same index and
+                               columns, one per metric
+    """
+    tstat, pvalue = {}, {}
+    for col in df.columns:
+        if col in id_columns:
+            tstat[col] = pvalue[col] = df[col]
+        elif col.endswith(PVALUE_SUFFIX) and col[:-len(PVALUE_SUFFIX)] in df.columns:
+            continue
+        elif f"{col}{PVALUE_SUFFIX}" in df.columns:
+            tstat[col] = pd.to_numeric(df[col], errors="coerce")
+            pvalue[col] = pd.to_numeric(df[f"{col}{PVALUE_SUFFIX}"], errors="coerce")
+        elif df[col].dtype.kind in "iufb":
+            tstat[col] = df[col]
+            pvalue[col] = pd.Series(np.nan, index=df.index)
+        else:
+            parts = [_split_pair(cell) for cell in df[col]]
+            tstat[col] = pd.to_numeric(pd.Series([t for t, _ in parts], index=df.index), errors="coerce")
+            pvalue[col] = pd.to_numeric(pd.Series([p for _, p in parts], index=df.index), errors="coerce")
+
+    return pd.DataFrame(tstat), pd.DataFrame(pvalue)
+
+
+def transform_tap_tstat_heatmap(df, pvalues=None, pvalue_threshold=0.05, id_column='Gene'):
+    """
+    Zeroes the tstat values that are not significant, for plotting.
+
+    Values whose p-value is greater than or equal to the threshold are set to
+    zero; values without a p-value are kept. `pvalues` is the parallel table
+    from split_tstat_pairs() (e.g. data["tap_tstat_pvalues"]); it is aligned
+    on the index, so it may cover more rows than `df`.
+
+    Inputs:
+        df (pd.DataFrame): tstat values, one row per id
+        pvalues (pd.DataFrame): Matching p-values (default: none, nothing is zeroed)
+        pvalue_threshold (float): Significance threshold
+        id_column (str): Id column, left as is (as are other non-numeric columns)
+
+    Returns:
+        pd.DataFrame: Copy of `df` with non-significant values set to zero
     """
     transformed_df = df.copy()
-    value_columns = [col for col in transformed_df.columns if col != id_column]
-
-    def _extract_value(cell):
-        if isinstance(cell, (tuple, list, np.ndarray)):
-            if len(cell) >= 2:
-                value, p_value = cell[0], cell[1]
-                if pd.notna(p_value) and p_value >= pvalue_threshold:
-                    return 0.0
-                return value
-            if len(cell) == 1:
-                return cell[0]
-        return cell
-
-    for column in value_columns:
-        transformed_df[column] = transformed_df[column].apply(_extract_value)
+    if pvalues is None:
+        return transformed_df
+
+    value_columns = [col for col in transformed_df.select_dtypes(include=np.number).columns if col != id_column]
+    p = pvalues.reindex(index=transformed_df.index, columns=value_columns).to_numpy(dtype=float)
+    transformed_df[value_columns] = np.where(p >= pvalue_threshold, 0.0, transformed_df[value_columns].to_numpy(dtype=float))
 
     return transformed_df
 
 
-def read(table, connection):
+# Postgres type OIDs that can be decoded straight into Arrow columns from CSV
+_ARROW_TYPES = {
+    16: pa.bool_(),         # bool
+    20: pa.int64(),         # int8
+    21: pa.int64(),         # int2
+    23: pa.int64(),         # int4
+    700: pa.float64(),      # float4
+    701: pa.float64(),      # float8
+    1700: pa.float64(),     # numeric
+    18: pa.string(),        # char
+    19: pa.string(),        # name
+    25: pa.string(),        # text
+    1042: pa.string(),      # bpchar
+    1043: pa.string(),      # varchar
+    1082: pa.date32(),      # date
+    1114: pa.timestamp("ns"),  # timestamp
+}
+
+
+class _CopyStream(io.RawIOBase):
     """
-    Fetches all rows from a specified table in a PostgreSQL database.
-    
+    File-like wrapper around a psycopg Copy object so Arrow can pull the
+    COPY output in large blocks instead of buffering the whole table.
+    """
+    def __init__(self, copy):
+        self._copy = copy
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # libpq hands out one row per read(), so gather rows until the buffer is full
+        size = len(buffer)
+        rows = [self._pending]
+        total = len(self._pending)
+        read_row = self._copy.read
+        while total < size:
+            row = read_row()
+            if not row:
+                break
+            rows.append(row)
+            total += len(row)
+        block = b"".join(rows)
+        n = min(size, len(block))
+        buffer[:n] = block[:n]
+        self._pending = block[n:]
+        return n
+
+
+def read(table, connection, columns=None, where=None, params=None, order_by=None):
+    """
+    Fetches rows from a specified table in a PostgreSQL database.
+
+    Rows are streamed with `COPY ... TO STDOUT` and decoded by Arrow directly into
+    typed columns, so no per-row Python objects are created. Tables containing
+    column types Arrow cannot decode from COPY output (arrays, json, ...) fall back
+    to a regular cursor fetch.
+
     Inputs:
         table (str): table name in PostgreSQL database
         connection (psycopg.Connection): Active psycopg database connection
-    
-    Returns:  
+        columns (list of str): Optional list of columns to read (default: all)
+        where (str or psycopg.sql.Composable): Optional SQL condition, may
+                                              contain %s placeholders
+        params (tuple): Values for the placeholders in `where`
+        order_by (list of str): Optional columns to sort the rows by (default:
+                                the order PostgreSQL returns them in)
+
+    Returns:
         pd.DataFrame: Table data as a DataFrame
     """
+    query = sql.SQL("SELECT {columns} FROM {table}").format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)) if columns else sql.SQL("*"),
+        table=sql.Identifier(table),
+    )
+    if where:
+        if not isinstance(where, sql.Composable):
+            where = sql.SQL(where)
+        query = sql.SQL("{query} WHERE {where}").format(query=query, where=where)
+    if order_by:
+        query = sql.SQL("{query} ORDER BY {columns}").format(
+            query=query, columns=sql.SQL(", ").join(map(sql.Identifier, order_by)))
+
     with connection.cursor() as cursor:
-        cursor.execute(f'SELECT * from "{table}"')
+        # Look up column names and types without reading any rows
+        cursor.execute(sql.SQL("SELECT * FROM ({query}) AS q LIMIT 0").format(query=query), params)
+        column_names = [desc.name for desc in cursor.description]
+        type_codes = [desc.type_code for desc in cursor.description]
 
-        # Fetch all rows from database
-        record = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
+        if not all(code in _ARROW_TYPES for code in type_codes):
+            cursor.execute(query, params)
 
-    return pd.DataFrame(data=record, columns=column_names)
+            # Fetch all rows from database
+            record = cursor.fetchall()
+            return pd.DataFrame(data=record, columns=column_names)
+
+        copy_query = sql.SQL("COPY ({query}) TO STDOUT (FORMAT CSV, HEADER)").format(query=query)
+        with cursor.copy(copy_query, params) as copy:
+            arrow_table = pacsv.read_csv(
+                _CopyStream(copy),
+                read_options=pacsv.ReadOptions(column_names=column_names, skip_rows=1),
+                parse_options=pacsv.ParseOptions(newlines_in_values=True),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=dict(zip(column_names, (_ARROW_TYPES[code] for code in type_codes))),
+                    null_values=[""],
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                    true_values=["t"],
+                    false_values=["f"],
+                ),
+            )
+
+    return arrow_table.to_pandas()
 
 
 @st.cache_data
@@ -110,58 +284,184 @@ def aggregate_unique_values_MSD(df, by):
     # Define the columns to aggregate
     agg_cols = [col for col in df.columns if col not in by + ['Screen']]
 
-    def _aggregate_group(group):
-        values = {}
-
-        for col in agg_cols:
-            if '-mean' in col:
-                count_col = col.replace('-mean', '-count')
-                if count_col in group.columns:
-                    denominator = group[count_col].sum()
-                    values[col] = (
-                        (group[col] * group[count_col]).sum() / denominator
-                        if denominator
-                        else np.nan
-                    )
-                else:
-                    values[col] = np.nan
-            elif '-sem' in col:
-                count_col = col.replace('-sem', '-count')
-                if count_col in group.columns:
-                    denominator = group[count_col].sum()
-                    values[col] = (
-                        np.sqrt((group[col] ** 2 * group[count_col]).sum() / denominator)
-                        if denominator
-                        else np.nan
-                    )
-                else:
-                    values[col] = np.nan
-            elif '-count' in col:
-                values[col] = group[col].sum()
-            else:
-                values[col] = np.nan
-
-        return pd.Series(values)
+    # Parse the '<metric>-<stat>' columns once; stats without a matching
+    # '-count' column (and anything else, e.g. the old CIs) aggregate to NaN
+    mean_cols = [col for col in agg_cols if '-mean' in col and col.replace('-mean', '-count') in df.columns]
+    sem_cols = [col for col in agg_cols if '-mean' not in col and '-sem' in col and col.replace('-sem', '-count') in df.columns]
+    count_cols = [col for col in agg_cols if '-mean' not in col and '-sem' not in col and '-count' in col]
+
+    # Sort the rows by group once, keeping their order within each group
+    groups = df.groupby(by)
+    codes = groups.ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    bounds = np.searchsorted(codes[order], np.arange(groups.ngroups + 1))
+
+    def _group_sum(values, columns):
+        # Sums every column of every group in one np.add.reduceat() call over
+        # the rows sorted by group. NaNs are skipped (an all-NaN group sums to
+        # 0). reduceat adds in a different order than Series.sum(), so a sum
+        # can differ from it in the last bit.
+        values = np.where(np.isnan(values), 0.0, values)[order]
+        if groups.ngroups:
+            sums = np.add.reduceat(values, bounds[:-1], axis=0)
+        else:
+            sums = np.zeros((0, len(columns)))
+        return pd.DataFrame(sums, index=groups.size().index, columns=columns)
 
     # Aggregate the columns using a weighted average
     with np.errstate(divide='ignore', invalid='ignore'):
-        grouped = df.groupby(by).apply(_aggregate_group).reset_index()
+        mean_counts = df[[col.replace('-mean', '-count') for col in mean_cols]].to_numpy(dtype=float)
+        mean_weights = _group_sum(mean_counts, mean_cols)
+        means = _group_sum(df[mean_cols].to_numpy(dtype=float) * mean_counts, mean_cols) / mean_weights.where(mean_weights != 0)
+
+        sem_counts = df[[col.replace('-sem', '-count') for col in sem_cols]].to_numpy(dtype=float)
+        sem_weights = _group_sum(sem_counts, sem_cols)
+        sems = np.sqrt(_group_sum(df[sem_cols].to_numpy(dtype=float) ** 2 * sem_counts, sem_cols) / sem_weights.where(sem_weights != 0))
+
+        counts = _group_sum(df[count_cols].to_numpy(dtype=float), count_cols)
+
+    values = pd.concat([means, sems, counts], axis=1).reindex(columns=agg_cols).astype(float)
 
     # Calculate new confidence intervals
+    ci_means = [
+        col for col in agg_cols
+        if '-mean' in col
+        and col.replace('-mean', '-sem') in agg_cols
+        and col.replace('-mean', '-count') in agg_cols
+    ]
+    mean = values[ci_means].to_numpy()
+    sem = values[[col.replace('-mean', '-sem') for col in ci_means]].to_numpy()
+    count = values[[col.replace('-mean', '-count') for col in ci_means]].to_numpy()
     with np.errstate(divide='ignore', invalid='ignore'):
-        for col in grouped.columns:
-            if '-mean' in col:
-                mean_col = col
-                sem_col = col.replace('-mean', '-sem')
-                count_col = col.replace('-mean', '-count')
-                ci95_lo_col = col.replace('-mean', '-ci95_lo')
-                ci95_hi_col = col.replace('-mean', '-ci95_hi')
-
-                if sem_col in grouped.columns and count_col in grouped.columns:
-                    grouped[ci95_lo_col] = grouped[mean_col] - 1.96 * grouped[sem_col] / np.sqrt(grouped[count_col])
-                    grouped[ci95_hi_col] = grouped[mean_col] + 1.96 * grouped[sem_col] / np.sqrt(grouped[count_col])
+        half_width = 1.96 * sem / np.sqrt(count)
+    ci = pd.DataFrame(
+        np.stack([mean - half_width, mean + half_width], axis=2).reshape(len(values), 2 * len(ci_means)),
+        index=values.index,
+        columns=[col.replace('-mean', suffix) for col in ci_means for suffix in ('-ci95_lo', '-ci95_hi')],
+    )
 
     # Aggregate the Screen column into a list
-    grouped['Screen'] = df.groupby(by)['Screen'].apply(lambda x: list(set(x))).reset_index(drop=True)
+    screens = groups['Screen'].agg(lambda x: list(set(x))).rename('Screen')
+
+    # Assemble the columns in one go; new CIs replace the old CI columns in place
+    columns = agg_cols + [col for col in ci.columns if col not in agg_cols] + ['Screen']
+    grouped = pd.concat([values.drop(columns=ci.columns, errors='ignore'), ci, screens], axis=1)[columns].reset_index()
 
     return grouped
+
+
+# Tap response metrics with a habituation curve on the gene and allele pages
+HABITUATION_METRICS = ["Probability", "Duration", "Speed",
+                       "PSA Speed",
+                       # "PSA Interval Speed",
+                       "PSA Bias", "PSA Kink", "PSA Crab",
+                       "PSA Aspect Ratio", "PSA Curve"]
+
+# Columns a tap summary row is kept per
+TAP_SUMMARY_KEYS = ["Screen", "dataset", "Gene", "Allele", "Date", "taps"]
+
+
+def summarise_taps(tap_output):
+    """
+    Summarises the tap responses of every strain and experiment date per tap,
+    so habituation curves are drawn without going back to the plate rows.
+    Transforms tap_response_data (tap_output) into tap_summary.
+
+    Inputs:
+        tap_output (pd.DataFrame): One row per plate and tap
+
+    Returns:
+        pd.DataFrame: One row per Screen, dataset, Gene, Allele, Date and taps,
+                      with '<metric>-mean', '<metric>-sem' (standard error of
+                      the mean, NaN for a single plate) and '<metric>-count'
+                      (plates with a value) for each of HABITUATION_METRICS
+    """
+    metrics = [metric for metric in HABITUATION_METRICS if metric in tap_output.columns]
+    rows = tap_output.dropna(subset=["taps"])
+    grouped = rows.groupby(TAP_SUMMARY_KEYS, observed=True, dropna=False, sort=False)[metrics]
+
+    stats = {"mean": grouped.mean(), "sem": grouped.sem(), "count": grouped.count()}
+    summary = pd.concat(
+        {f"{metric}-{stat}": stats[stat][metric] for metric in metrics for stat in stats}, axis=1
+    ).reset_index()
+    summary["taps"] = summary["taps"].astype(int)
+
+    return summary
+
+
+def pool_taps(tap_summary, id_col, ids, control="N2"):
+    """
+    Pools tap_summary rows into habituation curves: the strains in `ids` and
+    the control, over every experiment date on which one of `ids` was tested.
+    Means and standard errors are those of all the pooled plates, as if the
+    curve were computed from the plate rows.
+
+    Inputs:
+        tap_summary (pd.DataFrame): From summarise_taps(), N2 aliases mapped to "N2"
+        id_col (str): "Gene" or "dataset"
+        ids (list of str): Selected genes or alleles
+        control (str): Control strain drawn alongside them
+
+    Returns:
+        pd.DataFrame: One row per id and taps, ids in order of first
+                      appearance, with the '<metric>-mean', '-sem' and '-count'
+                      columns of tap_summary
+    """
+    dates = tap_summary.loc[tap_summary[id_col].isin(ids), "Date"].unique()
+    rows = tap_summary[tap_summary["Date"].isin(dates) & tap_summary[id_col].isin([control, *ids])]
+    rows = rows.assign(**{id_col: rows[id_col].astype(object)})
+
+    metrics = [col[:-len("-mean")] for col in rows.columns if col.endswith("-mean")]
+    parts = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for metric in metrics:
+            n = rows[f"{metric}-count"].to_numpy(dtype=float)
+            mean = rows[f"{metric}-mean"].to_numpy(dtype=float)
+            # Variance of the plates behind each row, 0 for single plates
+            var = np.nan_to_num(rows[f"{metric}-sem"].to_numpy(dtype=float) ** 2 * n)
+            parts[f"{metric}-sum"] = np.where(n > 0, mean * n, 0.0)
+            parts[f"{metric}-squares"] = np.where(n > 0, (n - 1) * var + n * mean ** 2, 0.0)
+            parts[f"{metric}-count"] = n
+    sums = pd.DataFrame(parts, index=rows.index).groupby([rows[id_col], rows["taps"]], sort=False).sum()
+
+    curves = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for metric in metrics:
+            n = sums[f"{metric}-count"]
+            mean = sums[f"{metric}-sum"] / n
+            var = ((sums[f"{metric}-squares"] - n * mean ** 2) / (n - 1)).clip(lower=0)
+            curves[f"{metric}-mean"] = mean.where(n > 0)
+            curves[f"{metric}-sem"] = np.sqrt(var / n).where(n > 1)
+            curves[f"{metric}-count"] = n.astype(int)
+    curves = pd.DataFrame(curves).reset_index()
+
+    # Ids in order of first appearance, as seaborn drew them, each in tap order
+    rank = curves[id_col].map({value: k for k, value in enumerate(pd.unique(rows[id_col]))})
+    return curves.iloc[np.lexsort((curves["taps"].to_numpy(), rank.to_numpy()))].reset_index(drop=True)
+
+
+# Pooled curve selections kept in memory across sessions, and the seconds each is kept
+CURVE_CACHE_ENTRIES = 64
+CURVE_CACHE_TTL = 3600
+
+
+@st.cache_data(max_entries=CURVE_CACHE_ENTRIES, ttl=CURVE_CACHE_TTL, show_spinner=False)
+def habituation_curves(version, datasets, id_col, ids, _tap_summary):
+    """
+    Pools the habituation curves of the selected genes or alleles once per
+    data version, screen selection and selection of ids, for every session.
+    Past CURVE_CACHE_ENTRIES selections the least recently used are dropped.
+
+    Inputs:
+        version (str): Version of the page's data (data["version"])
+        datasets (tuple of str): Selected screens, sorted
+        id_col (str): "Gene" or "dataset"
+        ids (tuple of str): Selected genes or alleles
+        _tap_summary (pd.DataFrame): The page's tap_summary; not hashed, as
+                                     version and datasets determine it
+
+    Returns:
+        pd.DataFrame: As returned by pool_taps()
+    """
+    return pool_taps(_tap_summary, id_col, list(ids))
@@ -0,0 +1,144 @@
+# utils/materialize.py
+from psycopg import sql
+from utils.snapshot import database_version
+
+# Log of materialized tables and the source version each one was built from
+MATERIALIZED_LOG = "materialized_tables"
+
+# pandas dtype kind -> PostgreSQL column type
+_PG_TYPES = {
+    "b": "boolean",
+    "i": "bigint",
+    "u": "bigint",
+    "f": "double precision",
+    "M": "timestamp",
+}
+
+
+def materialized_version(connection, table):
+    """
+    Looks up the source version a materialized table was built from.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        table (str): Materialized table name
+
+    Returns:
+        str: Source version, or None if the table has not been materialized
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'"{MATERIALIZED_LOG}"',))
+        if not cursor.fetchone()[0]:
+            return None
+        cursor.execute(
+            sql.SQL("SELECT source_version FROM {log} WHERE name = %s").format(log=sql.Identifier(MATERIALIZED_LOG)),
+            (table,),
+        )
+        row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def is_current(connection, source, tables):
+    """
+    Checks that every materialized table is up to date with its source table.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        source (str): Source table the tables are built from
+        tables (list of str): Materialized table names
+
+    Returns:
+        bool: True if all tables were built from the current source contents
+    """
+    version = database_version(connection, [source])
+    return all(materialized_version(connection, table) == version for table in tables)
+
+
+def write_table(connection, table, df, source, version):
+    """
+    Replaces a materialized table with the contents of a DataFrame.
+
+    The rows are copied into a new table which is swapped in, and the log
+    entry updated, in a single transaction, so readers see either the old or
+    the new table but never a partial one.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        table (str): Materialized table name
+        df (pd.DataFrame): Rows to write
+        source (str): Source table the rows were built from
+        version (str): Source version the rows were built from
+    """
+    new_table = f"{table}__new"
+    columns = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(_PG_TYPES.get(df[col].dtype.kind, "text")))
+        for col in df.columns
+    )
+    # NaN -> NULL, numpy scalars -> Python values
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+    with connection.transaction():
+        with connection.cursor() as cursor:
+            _create_log(cursor)
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(new_table)))
+            cursor.execute(sql.SQL("CREATE TABLE {} ({})").format(sql.Identifier(new_table), columns))
+            with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN").format(
+                sql.Identifier(new_table),
+                sql.SQL(", ").join(map(sql.Identifier, df.columns)),
+            )) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            _swap_in(cursor, table, source, version)
+
+
+def write_query(connection, table, query, source, version, indexes=()):
+    """
+    Replaces a materialized table with the result of a query run on the server.
+
+    Used for tables too large to pass through pandas. As with write_table(),
+    the new table is swapped in and the log entry updated in one transaction.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        table (str): Materialized table name
+        query (psycopg.sql.Composable): SELECT producing the rows
+        source (str): Source table the rows are built from
+        version (str): Source version the rows are built from
+        indexes (list of list of str): Column lists to index the table on
+    """
+    new_table = f"{table}__new"
+
+    with connection.transaction():
+        with connection.cursor() as cursor:
+            _create_log(cursor)
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(new_table)))
+            cursor.execute(sql.SQL("CREATE TABLE {} AS {}").format(sql.Identifier(new_table), query))
+            _swap_in(cursor, table, source, version)
+            for columns in indexes:
+                cursor.execute(sql.SQL("CREATE INDEX {} ON {} ({})").format(
+                    sql.Identifier(f"{table}__{'_'.join(columns)}"),
+                    sql.Identifier(table),
+                    sql.SQL(", ").join(map(sql.Identifier, columns)),
+                ))
+
+
+def _create_log(cursor):
+    cursor.execute(sql.SQL(
+        "CREATE TABLE IF NOT EXISTS {log} ("
+        "name text PRIMARY KEY, source text, source_version text, created timestamptz)"
+    ).format(log=sql.Identifier(MATERIALIZED_LOG)))
+
+
+def _swap_in(cursor, table, source, version):
+    # Replaces `table` with `{table}__new` and records the source version
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(sql.Identifier(f"{table}__new"), sql.Identifier(table)))
+    cursor.execute(
+        sql.SQL(
+            "INSERT INTO {log} (name, source, source_version, created) VALUES (%s, %s, %s, now()) "
+            "ON CONFLICT (name) DO UPDATE SET source = EXCLUDED.source, "
+            "source_version = EXCLUDED.source_version, created = EXCLUDED.created"
+        ).format(log=sql.Identifier(MATERIALIZED_LOG)),
+        (table, source, version),
+    )
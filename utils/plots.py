@@ -0,0 +1,243 @@
+# utils/plots.py
+import io
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_hex
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from scipy.cluster.hierarchy import leaves_list, linkage
+from utils.figure_cache import cached_figure
+
+# Point and error bar colors of the rank plots, by class; later classes are
+# drawn on top
+RANK_COLORS = {"other": "dimgray", "highlight": "magenta", "control": "red"}
+
+
+def rank_figure(data_sorted, phenotype, id_col, highlight=(), control="N2"):
+    """
+    Builds the "Rank in phenotype" chart: the sample mean distance of every
+    strain with its 95% CI, one row per strain in the order of `data_sorted`.
+
+    Points are drawn as one trace per color class, with array-valued error
+    bars (Plotly takes one error bar color per trace), rather than one trace
+    per strain, so the figure stays small with hundreds of strains. Pages add
+    their own layout (title, size, annotations) to the returned figure.
+
+    Inputs:
+        data_sorted (pd.DataFrame): gene_MSD or allele_MSD, in plotting order
+        phenotype (str): Metric, whose "-mean", "-ci95_lo" and "-ci95_hi" columns are plotted
+        id_col (str): Id column on the y axis ("Gene" or "dataset")
+        highlight (list of str): Ids drawn in magenta (e.g. the selected genes)
+        control (str): Control id, drawn in red
+
+    Returns:
+        go.Figure: The chart
+    """
+    ids = data_sorted[id_col].astype(object).to_numpy()
+    mean = data_sorted[f"{phenotype}-mean"].to_numpy(dtype=float)
+    upper = data_sorted[f"{phenotype}-ci95_hi"].to_numpy(dtype=float) - mean
+    lower = mean - data_sorted[f"{phenotype}-ci95_lo"].to_numpy(dtype=float)
+
+    classes = np.where(ids == control, "control", np.where(np.isin(ids, list(highlight)), "highlight", "other"))
+
+    fig = go.Figure()
+    for point_class, color in RANK_COLORS.items():
+        rows = classes == point_class
+        if not rows.any():
+            continue
+        fig.add_trace(go.Scatter(
+            x=mean[rows],
+            y=ids[rows],
+            error_x=dict(
+                type='data',
+                array=upper[rows],
+                arrayminus=lower[rows],
+                visible=True,
+                color=color,
+                thickness=3,
+                width=0
+            ),
+            mode='markers',
+            marker=dict(
+                color=color,
+                size=12,
+                symbol='circle',
+                line=dict(
+                    color='rgb(0,0,0)',
+                    width=1
+                ),
+            ),
+            showlegend=False,
+            name=""
+        ))
+
+    # Keep the rows in the order of data_sorted, whichever trace they are in
+    fig.update_yaxes(categoryorder="array", categoryarray=pd.unique(ids))
+
+    return fig
+
+
+def habituation_figure(curves, id_col, metric, palette):
+    """
+    Builds the habituation curve of a tap response metric: the mean response
+    at every tap with its standard error, one line per strain.
+
+    Inputs:
+        curves (pd.DataFrame): From utils.helpers.pool_taps()
+        id_col (str): Id column of `curves` ("Gene" or "dataset")
+        metric (str): One of utils.helpers.HABITUATION_METRICS
+        palette (dict): Id -> matplotlib color, in legend order
+
+    Returns:
+        go.Figure: The chart
+    """
+    fig = go.Figure()
+    for strain, color in palette.items():
+        rows = curves[curves[id_col] == strain]
+        fig.add_trace(go.Scatter(
+            x=rows["taps"],
+            y=rows[f"{metric}-mean"],
+            error_y=dict(type='data', array=rows[f"{metric}-sem"], visible=True, thickness=1.5, width=0),
+            mode='lines+markers',
+            marker=dict(size=7, color=to_hex(color)),
+            line=dict(width=2, color=to_hex(color)),
+            name=str(strain)
+        ))
+
+    fig.update_layout(
+        title={'text': f"Habituation of Response {metric}"},
+        xaxis_title="Taps",
+        yaxis_title=metric,
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        font_color="black",
+        height=600,
+        xaxis=dict(dtick=5, showgrid=False, linecolor='black'),
+        yaxis=dict(range=[0, 1]) if metric == "Probability" else dict(rangemode="tozero"),
+        legend=dict(x=1, y=1, xanchor="right", yanchor="top"),
+        margin=dict(l=10, r=10, t=40, b=0),
+    )
+    fig.update_yaxes(showgrid=True, gridcolor='lightgray', linecolor='black')
+
+    return fig
+
+
+def habituation_png(curves, id_col, metric, palette):
+    """
+    Static version of habituation_figure() for download.
+
+    Inputs:
+        curves (pd.DataFrame): From utils.helpers.pool_taps()
+        id_col (str): Id column of `curves` ("Gene" or "dataset")
+        metric (str): One of utils.helpers.HABITUATION_METRICS
+        palette (dict): Id -> matplotlib color, in legend order
+
+    Returns:
+        bytes: PNG image
+    """
+    fig, ax = plt.subplots(figsize=(12, 10))
+    for strain, color in palette.items():
+        rows = curves[curves[id_col] == strain]
+        ax.errorbar(rows["taps"], rows[f"{metric}-mean"], yerr=rows[f"{metric}-sem"],
+                    fmt='o-', color=color, label=strain)
+    ax.set_xlabel("Taps", fontsize='12')
+    ax.set_ylabel(metric, fontsize='12')
+    ax.set_title(f"Habituation of Response {metric}", fontsize='16')
+    ax.set_ylim(0, 1 if metric == "Probability" else None)
+    ax.legend(loc='upper right', fontsize='12')
+
+    return figure_png(fig)
+
+
+def cluster_order(values):
+    """
+    Orders rows so that similar rows are next to each other: the leaf order
+    of an average-linkage hierarchical clustering on Euclidean distances,
+    with missing values counted as 0.
+
+    Inputs:
+        values (np.ndarray): One row per item (e.g. a gene's tstat values)
+
+    Returns:
+        np.ndarray: Row positions, in clustered order
+    """
+    if len(values) < 3:
+        return np.arange(len(values))
+    X = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0, posinf=0.0, neginf=0.0)
+    return leaves_list(linkage(X, method="average"))
+
+
+def bin_rows(df, max_rows):
+    """
+    Averages runs of consecutive rows so that at most `max_rows` rows are
+    left, for drawing tables too tall to show row by row. Bins differ in size
+    by at most one row; missing values are skipped in the means.
+
+    Inputs:
+        df (pd.DataFrame): Numeric values, indexed by row label
+        max_rows (int): Maximum number of rows to return
+
+    Returns:
+        pd.DataFrame: One row per bin, indexed by "first – last" row labels
+                      (just the label for single rows)
+        np.ndarray: Number of rows averaged into each bin
+    """
+    n = len(df)
+    if n <= max_rows:
+        return df, np.ones(n, dtype=int)
+
+    bins = np.arange(n) * max_rows // n
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    labels = df.index.to_numpy()
+    binned = df.groupby(bins).mean()
+    binned.index = [f"{labels[a]} – {labels[b]}" for a, b in zip(starts, ends)]
+    return binned, ends - starts + 1
+
+
+def figure_png(fig):
+    """
+    Saves a matplotlib figure as a 300 dpi PNG and closes it.
+
+    Inputs:
+        fig (matplotlib.figure.Figure): Figure to save
+
+    Returns:
+        bytes: The PNG
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def png_download(container, figure_key, render, args, file_name, key):
+    """
+    Download button for a static PNG of a figure, rendered only on request.
+
+    Pages show Plotly figures and export matplotlib versions of them, which
+    take several hundred milliseconds to draw at 300 dpi. "Download Plot"
+    renders the PNG with render(*args) and turns into a "Save PNG" button for
+    it; the next rerun shows "Download Plot" again, so reruns that don't ask
+    for the image never draw it. PNGs are kept in the figure cache, so the
+    same export is only drawn once.
+
+    Inputs:
+        container: Streamlit container (e.g. a column) to put the button in
+        figure_key (tuple): figure_key() of the Plotly figure the PNG shows
+        render (function): Draws the figure and returns the PNG bytes, e.g. with figure_png()
+        args (tuple): Arguments of render
+        file_name (str): Name of the downloaded file
+        key (str): Widget key
+    """
+    slot = container.empty()
+    if not slot.button("Download Plot", key=f"{key}_render"):
+        return
+    page, figure, digest = figure_key
+    png = cached_figure((page, f"{figure} png", digest), render, *args)
+    slot.download_button(label="Save PNG",
+                         data=png,
+                         file_name=file_name,
+                         mime="image/png",
+                         key=key,
+                         on_click="ignore")
@@ -1,62 +1,135 @@
 # utils/preprocess.py
 import streamlit as st
 import numpy as np
+import pandas as pd
+from utils.profiling import profiled
 
-def select_datasets(data):
+# Control strain aliases shown as plain "N2"
+N2_ALIASES = ["N2_N2", "N2_XJ1"]
+
+
+def _replace_categories(col, to_replace, value):
+    # Remaps the categories instead of the values, and drops categories the
+    # screen filter left unused (seaborn would still draw them)
+    col = col.cat.remove_unused_categories()
+    categories = col.cat.categories
+    if not categories.isin(to_replace).any():
+        return col
+    mapped = categories.where(~categories.isin(to_replace), value)
+    new_categories = mapped.unique()
+    new_codes = new_categories.get_indexer(mapped)
+    codes = col.cat.codes.to_numpy()
+    return pd.Series(
+        pd.Categorical.from_codes(np.where(codes >= 0, new_codes[codes], -1), categories=new_categories),
+        index=col.index,
+        name=col.name,
+    )
+
+
+def replace_controls(df):
+    """
+    Maps the N2 control aliases to "N2" in every column.
+
+    Categorical columns (see utils.dtypes) are remapped through their categories,
+    since replace() on categoricals is deprecated; other columns use replace().
+    """
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df.replace(N2_ALIASES, "N2").infer_objects(copy=False)
+
+    others = [col for col in df.columns if col not in categorical]
+    replaced = df[others].replace(N2_ALIASES, "N2").infer_objects(copy=False)
+    replaced = replaced.assign(**{col: _replace_categories(df[col], N2_ALIASES, "N2") for col in categorical})
+    return replaced[df.columns]
+
+
+def dataset_selector(screens):
     datasets = st.multiselect(
         label="Select Datasets",
-        options=sorted(data["gene_MSD"].Screen.unique()),
-        default=sorted(data["gene_MSD"].Screen.unique())[0],
+        options=screens,
+        default=screens[0],
         placeholder="make a selection",
         help="select and de-select datasets you want to analyze",
         key="datasetselection"
     )
 
-    data["datasets"] = datasets
+    return datasets
+
+
+# Columns the pages never use, dropped from the tstat tables and their
+# parallel p-value tables (which keep the same rows and columns)
+VIEW_DROP_COLUMNS = {
+    "tap_tstat_allele": ["Screen"],
+    "tap_tstat_allele_pvalues": ["Screen"],
+    "tap_tstat_data": ["Screen", "Peak Tap Number of PSA Angular Speed"],
+    "tap_tstat_pvalues": ["Screen", "Peak Tap Number of PSA Angular Speed"],
+}
 
+# Tables shown with the N2 control aliases mapped to "N2"
+VIEW_TABLES = [
+    "tap_output", "tap_summary", "psa_output", "gene_profile_data", "allele_profile_data", "gene_MSD", "allele_MSD",
+    *VIEW_DROP_COLUMNS,
+]
+
+
+def dataset_view(name, df):
+    """
+    Builds a table as the pages see it: N2 control aliases mapped to "N2" and,
+    for the tstat tables, the unused columns dropped. Other tables are
+    returned as they are.
+
+    Inputs:
+        name (str): Dashboard table name (e.g. "tap_output")
+        df (pd.DataFrame): Table, already cut to the selected screens
+
+    Returns:
+        pd.DataFrame: The table for display
+    """
+    if name not in VIEW_TABLES:
+        return df
+    return replace_controls(df.drop(columns=VIEW_DROP_COLUMNS.get(name, [])))
+
+
+def phenotype_names(msd):
+    """
+    Lists the metric names of the "<metric>-<stat>" columns of an MSD table.
+
+    Inputs:
+        msd (pd.DataFrame): gene_MSD or allele_MSD
+
+    Returns:
+        list of str: One name per column, in column order (with repeats)
+    """
     phenotype_list = []
-    for col in data["gene_MSD"].columns[1:]:
+    for col in msd.columns[1:]:
         col_split = col.split("-", 1)[0]
         phenotype_list.append(col_split)
     phenotype_list.remove('Screen')
 
-    dropna_features = list(np.unique(phenotype_list))
-    for f in [
-        'Spontaneous Recovery of Response Duration',
-        'Spontaneous Recovery of Response Probability',
-        'Spontaneous Recovery of Response Speed',
-        'Memory Retention of Response Duration',
-        'Memory Retention of Response Probability',
-        'Memory Retention of Response Speed'
-    ]:
-        dropna_features.remove(f)
-
-    data["phenotype_list"] = phenotype_list
+    return phenotype_list
 
-    data["tap_output"] = data["tap_output"][data["tap_output"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
 
-    data["psa_output"] = data["psa_output"][data["psa_output"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
+@profiled("select_datasets")
+def select_datasets(data, datasets):
+    """
+    Filters the loaded tables to the selected datasets and maps the N2 control
+    aliases to "N2" (see dataset_view()). Only tables present in `data` are
+    touched, so pages that load a subset of the tables work unchanged.
 
-    data["tap_tstat_allele"] = (
-        data["tap_tstat_allele"][data["tap_tstat_allele"]["Screen"].isin(datasets)]
-        # .dropna(subset=[col for col in dropna_features if col in data["tap_tstat_allele"].columns])
-        .drop(columns=["Screen"])
-        .replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
-    )
+    The dashboard gets the same tables from data_loader.fetch_views(), which
+    builds them once per screen selection instead of on every rerun.
+    """
+    data["datasets"] = datasets
 
-    data["tap_tstat_data"] = (
-        data["tap_tstat_data"][data["tap_tstat_data"]["Screen"].isin(datasets)]
-        # .dropna(subset=[col for col in dropna_features if col in data["tap_tstat_data"].columns])
-        .drop(columns=["Screen", "Peak Tap Number of PSA Angular Speed"])
-        .replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
-    )
+    # Metric names come from the "<metric>-<stat>" columns of either MSD table
+    msd = data.get("gene_MSD", data.get("allele_MSD"))
+    if msd is not None:
+        data["phenotype_list"] = phenotype_names(msd)
 
-    data["gene_profile_data"] = data["gene_profile_data"][data["gene_profile_data"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
-    
-    data["allele_profile_data"] = data["allele_profile_data"][data["allele_profile_data"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
-    
-    data["gene_MSD"] = data["gene_MSD"][data["gene_MSD"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
-    
-    data["allele_MSD"] = data["allele_MSD"][data["allele_MSD"]["Screen"].isin(datasets)].replace(["N2_N2", "N2_XJ1"], "N2").infer_objects(copy=False)
+    # tstat tables and their parallel p-value tables get the same treatment,
+    # so their rows stay aligned
+    for name in VIEW_TABLES:
+        if name in data:
+            data[name] = dataset_view(name, data[name][data[name]["Screen"].isin(datasets)])
 
     return data
@@ -0,0 +1,200 @@
+# utils/profiling.py
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+import pandas as pd
+import streamlit as st
+
+# Structured log of every profiled stage, one JSON object per line
+PROFILE_LOG = os.environ.get("MWT_PROFILE_LOG", os.path.join("logs", "profile.jsonl"))
+
+# Size in MB past which the log is moved to PROFILE_LOG + ".1" (replacing the
+# previous one) and a new log is started
+PROFILE_LOG_MB = float(os.environ.get("MWT_PROFILE_LOG_MB", 50))
+
+# Peak memory is traced with tracemalloc, which slows allocations down, so it
+# is only measured when MWT_PROFILE_MEMORY=1
+PROFILE_MEMORY = os.environ.get("MWT_PROFILE_MEMORY") == "1"
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def count_rows(result):
+    """
+    Counts the rows of a stage's result.
+
+    Inputs:
+        result: DataFrame, dict of DataFrames (e.g. from fetch_tables()) or anything else
+
+    Returns:
+        int: Number of rows, or None if the result holds no DataFrames
+    """
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, dict):
+        tables = [df for df in result.values() if isinstance(df, pd.DataFrame)]
+        return sum(len(df) for df in tables) if tables else None
+    return None
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    Times a stage of a script run: wall time, rows processed and, when
+    PROFILE_MEMORY is set, the peak of traced memory above the memory in use
+    when the stage started. Stages can be nested.
+
+    The record is added to the current run (see start_run()), or written to
+    the log right away when no run is active, e.g. in warm_cache.py. Peak
+    memory is process-wide, so it is approximate while other sessions run.
+
+    Inputs:
+        name (str): Stage name, e.g. "fetch_views" or "export: heatmap png"
+        rows (int): Rows processed, if known up front
+
+    Yields:
+        dict: The stage record; set record["rows"] inside the block if the
+              row count is only known there
+    """
+    stack = _stack()
+    record = {"stage": name, "depth": len(stack), "seconds": None, "rows": rows, "peak_MB": None}
+    if PROFILE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "peak": current}
+    else:
+        frame = {}
+    stack.append(frame)
+
+    # Added to the run when the stage starts, so the run lists stages in call order
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run["records"].append(record)
+
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - started, 4)
+        stack.pop()
+        if PROFILE_MEMORY:
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_MB"] = round((peak - frame["start"]) / 2**20, 3)
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+
+        if run is None:
+            write_records([record])
+
+
+def profiled(name):
+    """
+    Decorator form of stage(), counting the rows of the function's result
+    with count_rows().
+
+    Inputs:
+        name (str): Stage name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = function(*args, **kwargs)
+                record["rows"] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def start_run(page):
+    """
+    Starts collecting the stage records of one script run of the dashboard.
+
+    Inputs:
+        page (str): Page being rendered
+    """
+    _local.run = {
+        "run": uuid.uuid4().hex[:12],
+        "page": page,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "records": [],
+    }
+
+
+def finish_run():
+    """
+    Ends the current run and appends its records to PROFILE_LOG.
+
+    Returns:
+        pd.DataFrame: The run's stages in the order they started, with their
+                      stage, depth, seconds, rows and peak_MB
+    """
+    run = getattr(_local, "run", None)
+    _local.run = None
+    if run is None:
+        return pd.DataFrame(columns=["stage", "depth", "seconds", "rows", "peak_MB"])
+
+    write_records(run["records"], run=run["run"], page=run["page"], time=run["time"])
+    return pd.DataFrame(run["records"], columns=["stage", "depth", "seconds", "rows", "peak_MB"])
+
+
+def write_records(records, **fields):
+    """
+    Appends stage records to PROFILE_LOG as JSON lines, first rolling the
+    log over if it has grown past PROFILE_LOG_MB.
+
+    Inputs:
+        records (list of dict): Stage records from stage()
+        **fields: Values added to every line (run id, page, time)
+    """
+    if not PROFILE_LOG or not records:
+        return
+    fields.setdefault("time", datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"))
+    lines = "".join(json.dumps({**fields, **record}) + "\n" for record in records)
+    try:
+        os.makedirs(os.path.dirname(PROFILE_LOG) or ".", exist_ok=True)
+        with _log_lock:
+            if os.path.exists(PROFILE_LOG) and os.path.getsize(PROFILE_LOG) >= PROFILE_LOG_MB * 2**20:
+                os.replace(PROFILE_LOG, PROFILE_LOG + ".1")
+            with open(PROFILE_LOG, "a") as f:
+                f.write(lines)
+    except OSError:
+        # Profiling must never break a page
+        pass
+
+
+def profile_panel(stages):
+    """
+    Shows the stages of the current run in the sidebar, nested stages
+    indented under the stage they ran in.
+
+    Inputs:
+        stages (pd.DataFrame): Records returned by finish_run()
+    """
+    with st.sidebar.expander("Performance (admin)"):
+        if stages.empty:
+            st.write("No stages recorded.")
+            return
+        total = stages.loc[stages["depth"] == 0, "seconds"].sum()
+        st.write(f"Run time: {total:.2f} s")
+        shown = stages.assign(stage=["· " * depth + name for depth, name in zip(stages["depth"], stages["stage"])])
+        st.dataframe(shown.drop(columns="depth"), hide_index=True, use_container_width=True)
+        st.caption(f"Appended to {PROFILE_LOG}" if PROFILE_LOG else "Profile log disabled (MWT_PROFILE_LOG is empty)")
@@ -0,0 +1,246 @@
+# utils/snapshot.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Snapshots live next to the app unless MWT_SNAPSHOT_DIR points somewhere else
+# (e.g. a mounted volume in the container so they survive restarts)
+SNAPSHOT_DIR = os.environ.get(
+    "MWT_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".snapshots")
+)
+
+# Tables read by fetch_data(); any change to one of them invalidates the snapshot
+SOURCE_TABLES = [
+    "tap_response_data",
+    "tstat_gene_data",
+    "tstat_allele_data",
+    "gene_MSD",
+    "allele_MSD",
+    "psa_summarised_data",
+    "Gene_Allele_WormBaseID",
+]
+
+MANIFEST = "manifest.json"
+
+# Per-screen row counts of the source tables, written at ingest by record_load()
+LOAD_LOG = "load_log"
+
+
+def database_version(connection, tables=SOURCE_TABLES):
+    """
+    Computes a version string for the current contents of the source tables.
+
+    The version hashes the row count and the relation OID of every table, so it
+    changes when rows are appended (Step4 `if_exists='append'`) and when a table
+    is dropped and recreated (`if_exists='replace'`). Row counts are taken from
+    the load log where possible (see screen_marks()).
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        tables (list of str): Table names to include in the version
+
+    Returns:
+        str: Hex digest identifying the database contents
+    """
+    return marks_version(screen_marks(connection, tables), tables)
+
+
+def screen_marks(connection, tables=SOURCE_TABLES):
+    """
+    Reads per-screen high-water marks of the source tables: the relation OID of
+    every table and its row count per screen.
+
+    Comparing two sets of marks tells which screens were uploaded (or changed)
+    in between, and an OID change means the table was dropped and recreated.
+    Tables without a Screen column are counted as a whole, under screen None.
+
+    The counts come from the load log written by record_load() at ingest time,
+    so the data tables are not scanned. Tables missing from the log, or dropped
+    and recreated since they were logged, are counted directly instead.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        tables (list of str): Table names to include
+
+    Returns:
+        dict: {table: {"oid": int, "screens": {screen: row count}}}
+    """
+    oids = ", ".join(f"'\"{table}\"'::regclass::oid::bigint" for table in tables)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {oids}")
+        oids = dict(zip(tables, cursor.fetchone()))
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'"{LOAD_LOG}"',))
+        rows = []
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                f'SELECT table_name, oid, screen, rows FROM "{LOAD_LOG}" WHERE table_name = ANY(%s)',
+                (list(tables),),
+            )
+            rows = [row for row in cursor.fetchall() if oids[row[0]] == row[1]]
+
+    missing = [table for table in tables if table not in {row[0] for row in rows}]
+    if missing:
+        logger.info("Counting rows of %s, which are not in the load log", ", ".join(missing))
+        rows += _count_marks(connection, missing)
+
+    marks = {table: {"oid": oids[table], "screens": {}} for table in tables}
+    for table, oid, screen, count in rows:
+        marks[table]["screens"][screen] = count
+
+    return marks
+
+
+def record_load(connection, tables=SOURCE_TABLES):
+    """
+    Writes the current per-screen row counts of tables to the load log, which
+    screen_marks() reads instead of counting the tables on every check.
+
+    Run once after rows are written to any of the tables (the Step4 notebook
+    and materialize_tables.py do this). Until then the dashboard keeps serving
+    the contents it last saw for a table that was appended to, since the log
+    still matches its OID.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        tables (list of str): Table names to count and log
+    """
+    with connection.transaction():
+        rows = _count_marks(connection, tables)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS "{LOAD_LOG}" '
+                "(table_name text, oid bigint, screen text, rows bigint, loaded timestamptz)"
+            )
+            cursor.execute(f'DELETE FROM "{LOAD_LOG}" WHERE table_name = ANY(%s)', (list(tables),))
+            cursor.executemany(
+                f'INSERT INTO "{LOAD_LOG}" (table_name, oid, screen, rows, loaded) VALUES (%s, %s, %s, %s, now())',
+                rows,
+            )
+
+
+# Counts the rows of each table per screen: (table, oid, screen, count) rows
+def _count_marks(connection, tables):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT table_name FROM information_schema.columns "
+            "WHERE column_name = 'Screen' AND table_schema = current_schema() AND table_name = ANY(%s)",
+            (list(tables),),
+        )
+        with_screen = {row[0] for row in cursor.fetchall()}
+        query = " UNION ALL ".join(
+            f"SELECT '{table}', '\"{table}\"'::regclass::oid::bigint, \"Screen\"::text, count(*) FROM \"{table}\" GROUP BY \"Screen\""
+            if table in with_screen else
+            f"SELECT '{table}', '\"{table}\"'::regclass::oid::bigint, NULL, count(*) FROM \"{table}\""
+            for table in tables
+        )
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+def marks_version(marks, tables=SOURCE_TABLES):
+    """
+    Computes database_version() from high-water marks already read.
+
+    Inputs:
+        marks (dict): As returned by screen_marks()
+        tables (list of str): Table names to include in the version
+
+    Returns:
+        str: Hex digest identifying the database contents
+    """
+    state = [[table, marks[table]["oid"], sum(marks[table]["screens"].values())] for table in tables]
+    return hashlib.sha1(json.dumps(state).encode("utf-8")).hexdigest()[:16]
+
+
+def _snapshot_path(version, key):
+    return os.path.join(SNAPSHOT_DIR, f"{key}-{version}")
+
+
+def load_snapshot(version, key="all", tables=None):
+    """
+    Loads a previously saved data dict from Parquet files.
+
+    Inputs:
+        version (str): Database version the snapshot must match
+        key (str): Snapshot name, for callers that keep several snapshots
+        tables (list of str): Optional subset of tables to load (default: all)
+
+    Returns:
+        dict of pd.DataFrame, or None if there is no usable snapshot
+    """
+    path = _snapshot_path(version, key)
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if tables is None:
+            tables = manifest["tables"]
+        elif not set(tables) <= set(manifest["tables"]):
+            return None
+        data = {
+            name: pd.read_parquet(os.path.join(path, f"{name}.parquet"))
+            for name in tables
+        }
+    except Exception as e:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, e)
+        return None
+
+    return data
+
+
+def save_snapshot(data, version, key="all"):
+    """
+    Writes a data dict to Parquet files so later processes can skip the database.
+
+    The snapshot is written to a temporary directory and renamed into place, so a
+    reader never sees a half-written snapshot. Older snapshots with the same key
+    are removed once the new one is in place. Failures are logged, not raised:
+    the dashboard still works without a snapshot.
+
+    Inputs:
+        data (dict of pd.DataFrame): Tables to save
+        version (str): Database version the tables were built from
+        key (str): Snapshot name, for callers that keep several snapshots
+
+    Returns:
+        bool: True if the snapshot was written
+    """
+    path = _snapshot_path(version, key)
+    if os.path.exists(path):
+        return True
+
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=f".{key}-", dir=SNAPSHOT_DIR)
+    except OSError as e:
+        logger.warning("Could not create snapshot directory %s: %s", SNAPSHOT_DIR, e)
+        return False
+
+    try:
+        for name, df in data.items():
+            df.to_parquet(os.path.join(tmp_path, f"{name}.parquet"), index=False)
+        with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+            json.dump({"version": version, "tables": list(data), "created": time.time()}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning("Could not write snapshot %s: %s", path, e)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+
+    # keep only the newest snapshot for this key
+    for entry in os.listdir(SNAPSHOT_DIR):
+        if entry.startswith(f"{key}-") and entry != os.path.basename(path):
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, entry), ignore_errors=True)
+
+    return True
@@ -0,0 +1,181 @@
+# utils/synthetic.py
+import io
+import numpy as np
+import pandas as pd
+from psycopg import sql
+
+# Metrics of the tstat tables, in the column order Step4 writes them
+TSTAT_METRICS = [
+    'Morphwidth', 'Midline', 'Area', 'Speed', 'Angular Speed', 'Bias', 'Aspect Ratio', 'Kink', 'Curve',
+    'Crab', 'Pathlength',
+    *[f"{step} Response {m}" for step in ["Initial", "Final"] for m in ["Duration", "Probability", "Speed"]],
+    *[f"{step} PSA {m}" for step in ["Initial", "Final", "Peak", "Peak Tap Number of", "Average"]
+      for m in ["Speed", "Bias", "Angular Speed", "Aspect Ratio", "Kink", "Curve", "Crab"]],
+    *[f"{step} of Response {m}" for step in ["Habituation", "Spontaneous Recovery", "Memory Retention"]
+      for m in ["Duration", "Probability", "Speed"]],
+    *[f"{step} of PSA {m}" for step in ["Habituation", "Spontaneous Recovery", "Memory Retention", "Sensitization"]
+      for m in ["Speed", "Bias", "Angular Speed", "Aspect Ratio", "Kink", "Curve", "Crab"]],
+]
+
+# Metrics per tap of tap_response_data
+TAP_METRICS = ["Probability", "Duration", "Speed", "PSA Speed", "PSA Bias", "PSA Angular Speed",
+               "PSA Kink", "PSA Crab", "PSA Aspect Ratio", "PSA Curve"]
+
+# Summaries x metrics of psa_summarised_data ("<summary> PSA <metric>")
+PSA_SUMMARIES = ['Initial', 'Final', 'Recovery', 'Peak', 'Peak Tap Number', 'Average', 'Sensitization',
+                 'Habituation', 'Spontaneous Recovery', 'Memory Retention']
+PSA_METRICS = ['Speed', 'Bias', 'Angular Speed', 'Kink', 'Crab', 'Aspect Ratio', 'Curve']
+
+# Metrics per time point of tap_baseline_data
+BASELINE_METRICS = ['Speed', 'Bias', 'Morphwidth', 'Midline', 'Area', 'Angular Speed', 'Aspect Ratio',
+                    'Kink', 'Curve', 'Crab', 'Pathlength']
+
+# Taps per plate and baseline time points (seconds, every 0.5 s)
+N_TAPS = 30
+BASELINE_TIMES = np.arange(490, 590, 0.5)
+
+_PG_TYPES = {"f": "double precision", "i": "bigint", "O": "text"}
+
+
+def _plates(n_screens, n_genes, n_plates, alleles_per_gene, rng):
+    # One row per plate: Screen, dataset, Gene, Allele, Plate_id, Date.
+    # Each screen tests half of the genes plus the N2 control, which is
+    # "N2_XJ1" in the second screen as in the Neuron_Genes_Screen.
+    genes = np.array([f"gene-{i}" for i in range(n_genes)])
+    rows = []
+    for s in range(n_screens):
+        screen = f"Synthetic_{s}_Screen"
+        control = "N2_XJ1" if s == 1 else "N2"
+        picked = rng.choice(genes, size=max(1, n_genes // 2), replace=False)
+        strains = [("N2", control, control.split("_")[-1])] + [
+            (gene, f"{gene}_ok{a}", f"ok{a}") for gene in picked for a in range(alleles_per_gene)
+        ]
+        for p in range(n_plates):
+            date = f"2024{s % 12 + 1:02d}{p % 28 + 1:02d}"
+            for gene, dataset, allele in strains:
+                rows.append((screen, dataset, gene, allele, f"{date}_{dataset}_{p}", date))
+
+    return pd.DataFrame(rows, columns=["Screen", "dataset", "Gene", "Allele", "Plate_id", "Date"])
+
+
+def _repeat(plates, values, column):
+    # Every plate row once per value of `column`
+    out = plates.loc[plates.index.repeat(len(values))].reset_index(drop=True)
+    out.insert(len(plates.columns), column, np.tile(values, len(plates)))
+    return out
+
+
+def _msd(ids, id_col, rng):
+    columns = {}
+    for metric in TSTAT_METRICS:
+        mean = rng.normal(size=len(ids))
+        count = rng.integers(3, 20, size=len(ids))
+        sem = rng.uniform(0.05, 0.5, size=len(ids))
+        columns.update({
+            f"{metric}-mean": mean, f"{metric}-count": count, f"{metric}-sem": sem,
+            f"{metric}-ci95_hi": mean + 2 * sem, f"{metric}-ci95_lo": mean - 2 * sem,
+        })
+    return pd.concat([ids[["Screen", id_col]].reset_index(drop=True), pd.DataFrame(columns)], axis=1)
+
+
+def _tstat(ids, id_col, rng, tstat_format):
+    tstat = rng.normal(scale=2, size=(len(ids), len(TSTAT_METRICS)))
+    pvalue = rng.uniform(size=tstat.shape)
+    if tstat_format == "pairs":
+        # Tables written before Step4 split the pairs: "(tstat, p)" text
+        columns = {m: [f"({t!r}, {p!r})" for t, p in zip(tstat[:, i], pvalue[:, i])]
+                   for i, m in enumerate(TSTAT_METRICS)}
+    else:
+        columns = {}
+        for i, m in enumerate(TSTAT_METRICS):
+            columns[m] = tstat[:, i]
+            columns[f"{m} q"] = pvalue[:, i]
+    return pd.concat([ids[["Screen", id_col]].reset_index(drop=True), pd.DataFrame(columns)], axis=1)
+
+
+def synthetic_tables(n_screens=3, n_genes=40, n_plates=3, alleles_per_gene=2, seed=0, tstat_format="columns"):
+    """
+    Generates a synthetic MWT database with the tables and columns the
+    dashboard reads, at a configurable scale, for benchmarks and local runs
+    without the production database. Values are random; only the shapes,
+    names, dtypes and id structure (N2 controls, alleles per gene, plates per
+    screen) follow the real data.
+
+    Inputs:
+        n_screens (int): Number of screens
+        n_genes (int): Number of genes; each screen tests half of them
+        n_plates (int): Plates per strain and screen
+        alleles_per_gene (int): Alleles per gene
+        seed (int): Random seed, so the same arguments give the same tables
+        tstat_format (str): "columns" for "<metric>"/"<metric> q" float columns,
+                            "pairs" for the older "(tstat, p)" text cells
+
+    Returns:
+        dict of pd.DataFrame: Source table name -> rows
+    """
+    rng = np.random.default_rng(seed)
+    plates = _plates(n_screens, n_genes, n_plates, alleles_per_gene, rng)
+
+    tap = _repeat(plates, np.arange(1, N_TAPS + 1), "taps")
+    tap = pd.concat([tap, pd.DataFrame(rng.random((len(tap), len(TAP_METRICS))), columns=TAP_METRICS)], axis=1)
+    tap.loc[::97, "Probability"] = np.nan  # plates with missing taps
+
+    psa_columns = [f"{s} PSA {m}" for s in PSA_SUMMARIES for m in PSA_METRICS]
+    psa = pd.concat([plates, pd.DataFrame(rng.normal(size=(len(plates), len(psa_columns))), columns=psa_columns)], axis=1)
+
+    baseline = _repeat(plates, BASELINE_TIMES, "Time")
+    baseline["n"] = rng.integers(5, 30, size=len(baseline))
+    baseline["Number"] = baseline["n"] + rng.integers(0, 5, size=len(baseline))
+    baseline = pd.concat([baseline, pd.DataFrame(rng.random((len(baseline), len(BASELINE_METRICS))), columns=BASELINE_METRICS)], axis=1)
+
+    genes = plates.drop_duplicates(["Screen", "Gene"])
+    alleles = plates.drop_duplicates(["Screen", "dataset"])
+    strains = plates.drop_duplicates(["Gene", "Allele"])
+    ids = pd.DataFrame({
+        "Gene": strains["Gene"].to_numpy(),
+        "Allele": strains["Allele"].to_numpy(),
+        "Sequence": strains["Gene"].str.upper().to_numpy(),
+        "WBGene": [f"WBGene{i:08d}" for i in pd.factorize(strains["Gene"])[0]],
+        "WBAllele": [f"WBVar{i:08d}" for i in range(len(strains))],
+    })
+
+    return {
+        "tap_response_data": tap,
+        "psa_summarised_data": psa,
+        "tap_baseline_data": baseline,
+        "tstat_gene_data": _tstat(genes, "Gene", rng, tstat_format),
+        "tstat_allele_data": _tstat(alleles, "dataset", rng, tstat_format),
+        "gene_MSD": _msd(genes, "Gene", rng),
+        "allele_MSD": _msd(alleles, "dataset", rng),
+        "Gene_Allele_WormBaseID": ids,
+    }
+
+
+def load_synthetic(connection, tables, schema):
+    """
+    Writes synthetic tables into a PostgreSQL schema, replacing tables of the
+    same name in that schema. Rows are streamed with COPY.
+
+    Point a connection at the schema with the libpq option
+    `-c search_path=<schema>` to run the dashboard's loaders against it.
+
+    Inputs:
+        connection (psycopg.Connection): Active psycopg database connection
+        tables (dict of pd.DataFrame): Tables from synthetic_tables()
+        schema (str): Schema to write to, created if missing
+    """
+    with connection.transaction(), connection.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(schema)))
+        for name, df in tables.items():
+            table = sql.Identifier(schema, name)
+            columns = sql.SQL(", ").join(
+                sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(_PG_TYPES.get(df[col].dtype.kind, "text")))
+                for col in df.columns
+            )
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+            cursor.execute(sql.SQL("CREATE TABLE {} ({})").format(table, columns))
+            with cursor.copy(sql.SQL("COPY {} FROM STDIN (FORMAT CSV)").format(table)) as copy:
+                for start in range(0, len(df), 100_000):
+                    buffer = io.StringIO()
+                    df.iloc[start:start + 100_000].to_csv(buffer, header=False, index=False)
+                    copy.write(buffer.getvalue())
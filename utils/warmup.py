@@ -0,0 +1,138 @@
+# utils/warmup.py
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from streamlit import runtime
+from utils.dtypes import memory_report
+from utils.snapshot import SNAPSHOT_DIR, load_snapshot
+
+# Readiness report written by warm_caches(), for container probes
+READY_FILE = os.environ.get("MWT_READY_FILE", os.path.join(SNAPSHOT_DIR, "ready.json"))
+
+
+def write_readiness(report, path=READY_FILE):
+    """
+    Writes the readiness report as JSON, replacing the previous one atomically
+    so a probe never reads a half-written file.
+
+    Inputs:
+        report (dict): Report to write
+        path (str): Destination file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".ready-", dir=os.path.dirname(path) or ".")
+    with os.fdopen(fd, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_readiness(path=READY_FILE):
+    """
+    Reads the readiness report written by warm_caches().
+
+    Inputs:
+        path (str): Report file
+
+    Returns:
+        dict: The report, or None if there is none yet
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def warm_caches(path=READY_FILE):
+    """
+    Loads every dashboard table once so that the snapshot of every source's
+    current version exists before the dashboard takes traffic. Run in the
+    serving process (see start_warmup()) this also fills the in-memory caches;
+    run on its own (warm_cache.py) the first page load still reads the Parquet
+    files instead of querying and aggregating.
+
+    Progress goes to the readiness report at `path`: "warming" while loading,
+    then "ready" with the version, timings and table sizes, or "failed" with
+    the error (the dashboard still works, loading from the database).
+
+    Inputs:
+        path (str): Readiness report file
+
+    Returns:
+        dict: The final readiness report
+    """
+    # Imported here so that start_warmup() can run before Streamlit does, and
+    # the loaders' caches are only declared once its runtime exists
+    from utils.data_loader import SOURCE_LOADERS, fetch_data, fetch_marks, fetch_version, source_version
+
+    started = time.time()
+    write_readiness({"status": "warming", "started": started}, path)
+    try:
+        version = fetch_version()
+        marks = fetch_marks()
+        snapshot_hit = all(
+            load_snapshot(source_version(source, marks), key=source, tables=[]) is not None
+            for source in SOURCE_LOADERS
+        )
+        data = fetch_data()
+    except Exception as e:
+        report = {"status": "failed", "started": started, "seconds": round(time.time() - started, 3), "error": repr(e)}
+        write_readiness(report, path)
+        return report
+
+    sizes = memory_report(data)
+    report = {
+        "status": "ready",
+        "started": started,
+        "seconds": round(time.time() - started, 3),
+        "version": version,
+        "snapshot_hit": snapshot_hit,
+        "tables": {
+            row.table: {"rows": int(row.rows), "MB": round(float(row.MB), 3)}
+            for row in sizes.itertuples(index=False)
+        },
+    }
+    write_readiness(report, path)
+    return report
+
+
+def start_warmup(path=READY_FILE):
+    """
+    Runs warm_caches() in a background thread of the serving process, so the
+    in-memory caches that pages read are filled, not only the snapshots on
+    disk. The thread waits for the Streamlit runtime to start, so the cached
+    loaders store their results where the app's sessions will find them.
+
+    The readiness report is reset to "warming" straight away, so a report left
+    by a previous run is never taken for this one.
+
+    Inputs:
+        path (str): Readiness report file
+
+    Returns:
+        threading.Thread: The started thread
+    """
+    write_readiness({"status": "warming", "started": time.time()}, path)
+
+    def warm():
+        while not runtime.exists():
+            time.sleep(0.1)
+        # The warm-up has no session, so every cached loader call would warn
+        context_logger = logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context")
+        context_logger.addFilter(_no_context_warning)
+        try:
+            warm_caches(path)
+        finally:
+            context_logger.removeFilter(_no_context_warning)
+
+    thread = threading.Thread(target=warm, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+# Log filter dropping the "missing ScriptRunContext" warnings
+def _no_context_warning(record):
+    return "missing ScriptRunContext" not in record.getMessage()
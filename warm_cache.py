@@ -0,0 +1,20 @@
+# warm_cache.py
+#
+# Fills the dashboard's snapshot cache from a separate process (e.g. before
+# restarting a server, so it starts from fresh snapshots), and writes a
+# readiness report with timings and table sizes to .snapshots/ready.json
+# (override with MWT_READY_FILE). serve.py does the same inside the serving
+# process. Run from the repository root with the same .streamlit/secrets.toml
+# as the dashboard:
+#
+#     python warm_cache.py
+#
+# Exits with status 1 if the tables could not be loaded.
+import json
+import sys
+from utils.warmup import warm_caches
+
+if __name__ == '__main__':
+    report = warm_caches()
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["status"] == "ready" else 1)